@@ -0,0 +1,56 @@
+"""
+Compares the per-row iterrows formatting the get_* methods used to do with the column-wise result renderer
+and with the pandas-free row renderer.
+
+    python helpers/benchmarks/render_benchmark.py [rows]
+"""
+import os
+import sys
+import timeit
+
+import pandas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.result_renderer import render_frame, render_rows, RECENT_OUTAGES
+from helpers.string_builder import StringBuilder
+
+
+def render_iterrows(this_data):
+    sb = StringBuilder()
+    for k, row in this_data.iterrows():
+        sb.append("CreateDate: " + row.CreateDate.strftime("%Y %m %d - %H:%M:%S.%f") + '\r\n')
+        sb.append("IncidentId: " + str(row.IncidentId) + '\r\n')
+        sb.append("Severity: " + str(row.Severity) + '\r\n')
+        sb.append("OutageDeclaredDate: " + str(row.OutageDeclaredDate) + '\r\n')
+        sb.append("Link: " + "https://portal.microsofticm.com/imp/v3/incidents/details/"+str(row.IncidentId)+"/home"  + '\r\n')
+        sb.append('---------------------\r\n')
+    return (sb.getValue())
+
+
+def make_frame(rows):
+    create_date = pandas.date_range("2020-06-01", periods=rows, freq="37s", tz="UTC")
+    return pandas.DataFrame({
+        "CreateDate": create_date,
+        "IncidentId": range(180000000, 180000000 + rows),
+        "Severity": [i % 4 for i in range(rows)],
+        "OutageDeclaredDate": create_date + pandas.Timedelta(minutes=5),
+    })
+
+
+def main(rows=10000, repeat=5):
+    frame = make_frame(rows)
+    records = list(frame.itertuples(index=False, name='Row'))
+    expected = render_iterrows(frame)
+    if expected != render_frame(frame, RECENT_OUTAGES) or expected != render_rows(records, RECENT_OUTAGES):
+        raise SystemExit("Renderers disagree on the output")
+
+    for name, render in (("iterrows", lambda: render_iterrows(frame)),
+                         ("render_frame", lambda: render_frame(frame, RECENT_OUTAGES)),
+                         ("render_rows", lambda: render_rows(records, RECENT_OUTAGES))):
+        best = min(timeit.repeat(render, number=1, repeat=repeat))
+        print("{:<14}{:>8} rows {:>10.1f} ms".format(name, rows, best * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
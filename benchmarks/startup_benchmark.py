@@ -0,0 +1,64 @@
+"""
+Measures the cold start of the bot in fresh interpreters: the import time of the helper modules, the time to the
+first served turn ("show incident 180000000" recognized and answered from the Kusto stand-in, so without the
+network round trip), and that time again when the Kusto SDK was already imported by the warm-up the bot runs
+once it is listening.
+
+    python helpers/benchmarks/startup_benchmark.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HELPERS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import sys, time
+start = time.perf_counter()
+timings = {}
+
+import helpers.kusto_helper as kusto_helper
+timings["import kusto_helper"] = time.perf_counter() - start
+mark = time.perf_counter()
+from helpers.luis_helper import LuisHelper
+timings["import luis_helper"] = time.perf_counter() - mark
+imported = time.perf_counter() - start
+
+import asyncio, json
+from types import SimpleNamespace
+from helpers.kusto_replay import ReplayKustoClient, SyntheticIcm, install
+install(ReplayKustoClient(synthetic=SyntheticIcm(incidents=200)))
+
+if sys.argv[1] == "warm":
+    mark = time.perf_counter()
+    import azure.kusto.data.request
+    timings["warm up"] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+turn = SimpleNamespace(activity=SimpleNamespace(text="show incident 180000000"))
+intent, details = asyncio.get_event_loop().run_until_complete(LuisHelper.execute_luis_query(None, turn))
+answer = kusto_helper.kustoclient().get_incident(details.incidentids)
+timings["first turn, " + sys.argv[1]] = imported + time.perf_counter() - mark
+print(json.dumps(timings))
+'''
+
+
+def run_once(mode):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode], cwd=os.path.dirname(HELPERS), check=True, stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    results = [run_once(mode) for mode in ("cold", "warm") for _ in range(runs)]
+    for stage in ("import kusto_helper", "import luis_helper", "first turn, cold", "warm up", "first turn, warm"):
+        values = [result[stage] for result in results if stage in result]
+        print("{:<22}{:>10.1f} ms median {:>10.1f} ms max".format(
+            stage, statistics.median(values) * 1000, max(values) * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,42 @@
+"""
+Compares the dialog state ShowListDialog keeps per turn: the ShowListDetails object as the bot's storage
+serializes it (jsonpickle, like the Blob and Cosmos DB storages) against its compact to_state list.
+
+    python helpers/benchmarks/state_benchmark.py [runs]
+"""
+import json
+import os
+import sys
+import timeit
+
+import jsonpickle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from showlist_details import ShowListDetails
+
+DETAILS = [
+    ShowListDetails(alist="Incidents"),
+    ShowListDetails(alist="Changes", guid="7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6a", age="15"),
+    ShowListDetails(alist="Incident", incidentids=["173678618", "130063491"]),
+    ShowListDetails(alist="Outages", age=7, trend=True),
+]
+
+
+def main(runs=10000):
+    codecs = (
+        ("jsonpickle", lambda details: jsonpickle.encode(details), jsonpickle.decode),
+        ("to_state", lambda details: json.dumps(details.to_state(), separators=(",", ":")),
+         lambda text: ShowListDetails.from_state(json.loads(text))),
+    )
+    for name, encode, decode in codecs:
+        encoded = [encode(details) for details in DETAILS]
+        size = sum(len(text.encode("utf-8")) for text in encoded) / len(encoded)
+        write = min(timeit.repeat(lambda: [encode(details) for details in DETAILS], number=runs, repeat=3))
+        read = min(timeit.repeat(lambda: [decode(text) for text in encoded], number=runs, repeat=3))
+        print("{:<12}{:>8.0f} bytes {:>8.2f} us write {:>8.2f} us read".format(
+            name, size, write / runs / len(DETAILS) * 1e6, read / runs / len(DETAILS) * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,123 @@
+"""
+Drives MainDialog and ShowListDialog through concurrent simulated conversations against the Kusto and LUIS
+stand-ins (helpers.kusto_replay, helpers.luis_replay) and reports the throughput and the p50/p99 latency of
+each intent. A request the bot asks to confirm costs a second turn answering "yes"; the latency of the intent
+is the sum of its turns. Run it with CONFIRM_SKIP_THRESHOLD=2 to confirm every request. The incident asked
+about is one of those listed by the incidents answer before it, so its history may have been prefetched.
+
+    python helpers/benchmarks/turn_benchmark.py [--conversations 50] [--rounds 3] [--kusto-latency 0.2] [--luis-latency 0.1]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+HELPERS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(HELPERS))
+
+from botbuilder.core import ConversationState, MemoryStorage, TurnContext
+from botbuilder.core.adapters import TestAdapter
+from botbuilder.dialogs import DialogSet, DialogTurnStatus
+from botbuilder.schema import Activity, ChannelAccount, ConversationAccount
+
+from dialogs import MainDialog, ShowListDialog
+from helpers.kusto_helper import PAGE_SIZE, QUERY_TEMPLATES, incident_prefetch
+from helpers.kusto_replay import ReplayKustoClient, SyntheticIcm, install
+from helpers.luis_replay import ReplayLuisRecognizer
+from helpers.metrics import metrics
+
+# Each intent with the utterance asking for it; {incidentid} is one of the listed synthetic incidents.
+SCENARIOS = [
+    ("incidents", "show me a list of incidents"),
+    ("more", "show more"),
+    ("outages", "show me the new outages"),
+    ("changes", "show me all changes for service tree guid 7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c in last 3 days"),
+    ("incident", "please help on incident {incidentid}"),
+    ("trend", "show me the incidents trend for the last 30 days"),
+    ("report", "give me a situation report"),
+]
+
+
+async def run_dialog(dialog, turn_context: TurnContext, accessor):
+    dialog_set = DialogSet(accessor)
+    dialog_set.add(dialog)
+    dialog_context = await dialog_set.create_context(turn_context)
+    results = await dialog_context.continue_dialog()
+    if results.status == DialogTurnStatus.Empty:
+        await dialog_context.begin_dialog(dialog.id)
+
+
+async def converse(number, dialog, conversation_state, accessor, incidentids, rounds, latencies):
+    async def logic(turn_context: TurnContext):
+        await run_dialog(dialog, turn_context, accessor)
+        await conversation_state.save_changes(turn_context)
+
+    adapter = TestAdapter(logic, Activity(
+        channel_id="test",
+        service_url="https://test.com",
+        from_property=ChannelAccount(id="user{}".format(number)),
+        recipient=ChannelAccount(id="bot"),
+        conversation=ConversationAccount(id="conversation{}".format(number)),
+    ))
+    await adapter.receive_activity("hi")
+    for round_number in range(rounds):
+        incidentid = incidentids[(number * rounds + round_number) % len(incidentids)]
+        for intent, text in SCENARIOS:
+            start = time.perf_counter()
+            await adapter.receive_activity(text.format(incidentid=incidentid))
+            if any((activity.text or "").startswith("Please confirm") for activity in adapter.activity_buffer):
+                await adapter.receive_activity("yes")
+            latencies.setdefault(intent, []).append(time.perf_counter() - start)
+            adapter.activity_buffer.clear()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def main(arguments):
+    synthetic = SyntheticIcm(seed=arguments.seed)
+    kusto = ReplayKustoClient(synthetic=synthetic, latency=arguments.kusto_latency, jitter=0.5, seed=arguments.seed)
+    install(kusto)
+    luis = ReplayLuisRecognizer.from_files(
+        os.environ.get("LUIS_APP_DEFINITION", os.path.join(HELPERS, "IncidentLookup.json")), latency=arguments.luis_latency)
+
+    conversation_state = ConversationState(MemoryStorage())
+    accessor = conversation_state.create_property("DialogState")
+    dialog = MainDialog(luis, ShowListDialog())
+    _, listed = synthetic.table(QUERY_TEMPLATES["recent_incidents"], {"max_rows": PAGE_SIZE})
+    incidentids = [row[1] for row in listed]
+
+    latencies = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        converse(number, dialog, conversation_state, accessor, incidentids, arguments.rounds, latencies)
+        for number in range(arguments.conversations)
+    ))
+    elapsed = time.perf_counter() - start
+
+    answers = sum(len(values) for values in latencies.values())
+    print("{} conversations, {} answers in {:.1f} s: {:.1f} answers/s, {} Kusto queries, {} LUIS calls".format(
+        arguments.conversations, answers, elapsed, answers / elapsed, kusto.queries, luis.calls))
+    for intent, _ in SCENARIOS:
+        values = latencies[intent]
+        print("{:<10}{:>6} answers  p50 {:>8.1f} ms  p99 {:>8.1f} ms".format(
+            intent, len(values), percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000))
+    prefetch = incident_prefetch.stats()
+    print("incident prefetch: {} batches, {} incidents, {} lists skipped, hit rate {:.0%}".format(
+        prefetch["batches"], prefetch["prefetched"], prefetch["skipped"], prefetch["hit_rate"]))
+    if arguments.metrics:
+        print(metrics.dump())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--kusto-latency", type=float, default=0.2, help="seconds per Kusto query")
+    parser.add_argument("--luis-latency", type=float, default=0.1, help="seconds per LUIS call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics", action="store_true", help="also print the metrics snapshot")
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# Rows can be ingested a while after their ModifiedDate, so every poll looks back this far past the watermark.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+class IncidentPoller:
+    """
+    Keeps a hot in-memory snapshot of the incidents created in the last retention window.
+    Every interval seconds it asks Icmcluster only for the incidents modified since the previous poll
+    (the ModifiedDate watermark) and merges their latest state into the snapshot, so the "recent"
+    questions can be answered without rescanning IcM.
+    """
+
+    def __init__(self, client, interval=None, retention=None, max_staleness=None):
+        self.client = client
+        self.interval = float(interval or os.environ.get('INCIDENT_POLL_INTERVAL', 30))
+        self.retention = timedelta(minutes=float(retention or os.environ.get('INCIDENT_POLL_RETENTION_MINUTES', 120)))
+        # The snapshot answers questions only while its last successful poll is at most this many seconds old.
+        self.max_staleness = float(max_staleness or os.environ.get('INCIDENT_SNAPSHOT_MAX_STALENESS', 3 * self.interval))
+        self.last_success = None
+        self.last_error = None
+        self._watermark = None
+        self._incidents = {}
+        self._window = []
+        self._last_success_clock = None
+        self._task = None
+
+    def start(self):
+        """
+        Starts polling in the background on the running event loop. Calling it again does nothing.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.last_error = str(error)
+                print("ERROR: incident poll failed: ", error)
+            await asyncio.sleep(self.interval)
+
+    async def poll_once(self):
+        rows = await self.client.run_template_async('incident_snapshot', **self._parameters())
+        if rows is None:
+            raise RuntimeError("no answer from {}".format(self.client.kusto_cluster))
+        self._merge(rows)
+        self.last_success = datetime.now(timezone.utc)
+        self._last_success_clock = time.monotonic()
+        self.last_error = None
+
+    def _parameters(self):
+        if self._watermark is None:
+            since = datetime.now(timezone.utc) - self.retention
+        else:
+            since = (self._watermark - WATERMARK_OVERLAP).astimezone(timezone.utc)
+        return {
+            'window': '{}m'.format(int(self.retention.total_seconds() // 60)),
+            'since': since.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        }
+
+    def _merge(self, rows):
+        for row in rows:
+            known = self._incidents.get(str(row.IncidentId))
+            if known is None or row.ModifiedDate >= known.ModifiedDate:
+                self._incidents[str(row.IncidentId)] = row
+            if self._watermark is None or row.ModifiedDate > self._watermark:
+                self._watermark = row.ModifiedDate
+
+        horizon = datetime.now(timezone.utc) - self.retention
+        self._incidents = {key: row for key, row in self._incidents.items() if row.CreateDate > horizon}
+        # Newest first, so the recent questions read the head of the window.
+        self._window = sorted(self._incidents.values(), key=lambda row: (row.CreateDate, str(row.IncidentId)), reverse=True)
+
+    def staleness(self):
+        """
+        Seconds since the last successful poll, or None before the first one.
+        """
+        if self._last_success_clock is None:
+            return None
+        return time.monotonic() - self._last_success_clock
+
+    def is_fresh(self):
+        staleness = self.staleness()
+        return staleness is not None and staleness <= self.max_staleness
+
+    # after is the (CreateDate, IncidentId) of the last row already shown; the rows following it are returned.
+    def recent_incidents(self, since=timedelta(hours=1), limit=10, after=None):
+        return self._recent(since, limit, lambda row: row.Severity <= 2, after)
+
+    def recent_outages(self, since=timedelta(hours=1), limit=10, after=None):
+        return self._recent(since, limit, lambda row: row.IsOutage, after)
+
+    def _recent(self, since, limit, predicate, after=None):
+        horizon = datetime.now(timezone.utc) - since
+        after = None if after is None else (after[0], str(after[1]))
+        rows = []
+        for row in self._window:
+            if row.CreateDate <= horizon or len(rows) == limit:
+                break
+            if after is not None and (row.CreateDate, str(row.IncidentId)) >= after:
+                continue
+            if predicate(row):
+                rows.append(row)
+        return rows
+
+    def stats(self):
+        return {
+            "incidents": len(self._incidents),
+            "watermark": self._watermark.isoformat() if self._watermark is not None else None,
+            "last_success": self.last_success.isoformat() if self.last_success is not None else None,
+            "staleness_seconds": self.staleness(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from helpers.ttl_cache import TTLCache
+
+
+class IncidentPrefetch:
+    """
+    Per conversation store of the incident histories fetched ahead of time, after the conversation was shown
+    a list of incidents or outages. reserve registers a pending history for each listed incident, fill completes
+    them with the rows of one batched query, and get answers a later lookup from them, waiting at most wait
+    seconds for a batch still in flight. A conversation's histories expire ttl seconds after its last list.
+    At most max_pending batches are queued or running at once; lists shown beyond that are not prefetched.
+    """
+
+    def __init__(self, ttl=None, max_conversations=None, wait=None, max_pending=None):
+        self.ttl = float(ttl or os.environ.get('KUSTO_PREFETCH_TTL', 120))
+        # A batch is queued behind the queries users wait for, so a lookup only waits briefly for it before
+        # querying the incidents itself.
+        self.wait = float(wait or os.environ.get('KUSTO_PREFETCH_WAIT', 0.5))
+        self._conversations = TTLCache(
+            max_entries=int(max_conversations or os.environ.get('KUSTO_PREFETCH_CONVERSATIONS', 1024)),
+            default_ttl=self.ttl)
+        self.max_pending = int(max_pending or os.environ.get('KUSTO_PREFETCH_MAX_PENDING', 32))
+        self._lock = threading.Lock()
+        # Batches reserved and not yet filled or dropped.
+        self.pending = 0
+        # Lists not prefetched because max_pending batches were already pending.
+        self.skipped = 0
+        # Incidents of batches dropped unqueried because their conversation expired while they were queued.
+        self.dropped = 0
+        self.batches = 0
+        self.prefetched = 0
+        self.failed = 0
+        # Lookups that found their batch still in flight after waiting for it, and queried Kusto themselves.
+        self.late = 0
+        self.hits = 0
+        self.misses = 0
+
+    def reserve(self, conversation_id, incidentids):
+        """
+        Registers the incidents listed to the conversation and returns those whose history still has to be fetched,
+        none when max_pending batches are already pending. Each batch returned is completed by fill or drop.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.skipped += 1
+                return []
+            histories = dict(self._conversations.get(conversation_id) or {})
+            missing = [incidentid for incidentid in dict.fromkeys(str(i) for i in incidentids) if incidentid not in histories]
+            for incidentid in missing:
+                histories[incidentid] = Future()
+            self._conversations.put(conversation_id, histories)
+            if missing:
+                self.pending += 1
+                self.batches += 1
+                self.prefetched += len(missing)
+            return missing
+
+    def expired(self, conversation_id):
+        """
+        Whether the conversation's histories are no longer kept, so a batch still queued for it is not worth running.
+        """
+        with self._lock:
+            return self._conversations.get(conversation_id) is None
+
+    def fill(self, conversation_id, incidentids, rows):
+        """
+        Completes the reserved histories with the rows of their batched query; rows is None when it failed,
+        and those incidents are then looked up as usual.
+        """
+        history = {}
+        for row in rows or ():
+            history.setdefault(str(row.IncidentId), []).append(row)
+        with self._lock:
+            if rows is None:
+                self.failed += len(incidentids)
+        self._complete(conversation_id, incidentids, None if rows is None else history)
+
+    def drop(self, conversation_id, incidentids):
+        """
+        Completes the reserved histories without their query, as for a failed batch.
+        """
+        with self._lock:
+            self.dropped += len(incidentids)
+        self._complete(conversation_id, incidentids, None)
+
+    def _complete(self, conversation_id, incidentids, history):
+        with self._lock:
+            self.pending -= 1
+            histories = self._conversations.get_stale(conversation_id) or {}
+        for incidentid in incidentids:
+            future = histories.get(incidentid)
+            if future is not None and not future.done():
+                future.set_result(None if history is None else tuple(history.get(incidentid, ())))
+
+    def get(self, conversation_id, incidentids, timeout=None):
+        """
+        Returns the history rows of each incident keyed by IncidentId when all of them were prefetched for the
+        conversation, or None. A batch still in flight is waited for up to timeout seconds, by default wait.
+        """
+        timeout = self.wait if timeout is None else timeout
+        with self._lock:
+            histories = self._conversations.get(conversation_id) or {}
+        futures = [histories.get(str(incidentid)) for incidentid in incidentids]
+        result = None
+        late = False
+        if futures and None not in futures:
+            deadline = time.monotonic() + timeout
+            try:
+                result = {
+                    str(incidentid): future.result(max(0.0, deadline - time.monotonic()))
+                    for incidentid, future in zip(incidentids, futures)
+                }
+            except TimeoutError:
+                late = True
+            if result is not None and None in result.values():
+                result = None
+        with self._lock:
+            if late:
+                self.late += 1
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "conversations": len(self._conversations),
+                "pending": self.pending,
+                "skipped": self.skipped,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "prefetched": self.prefetched,
+                "failed": self.failed,
+                "late": self.late,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
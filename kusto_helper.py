@@ -1,21 +1,214 @@
 #encoding=utf-8
 
-import argparse
-import sys, io
-import os, re, os.path
+import io
+import os
 import logging
-import pandas
-import azure.kusto.data
-from azure.kusto.data.request import KustoClient, KustoConnectionStringBuilder
-from azure.kusto.data.exceptions import KustoServiceError
-from azure.kusto.data.helpers import dataframe_from_result_table
+import asyncio
+import functools
+import threading
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import traceback
-from nltk.tokenize import sent_tokenize
-import requests
 import json
 
+from helpers.ttl_cache import TTLCache
+from helpers.result_renderer import render_rows, render_trend, RECENT_INCIDENTS, RECENT_OUTAGES, RECENT_CHANGES, INCIDENT_HISTORY
+from helpers.incident_poller import IncidentPoller
+from helpers.incident_prefetch import IncidentPrefetch
+from helpers.metrics import metrics
+from helpers.kusto_scheduler import KustoScheduler, KustoUnavailableError, PRIORITY_BACKGROUND, PRIORITY_LIST, PRIORITY_LOOKUP
+from helpers.pattern_extractor import is_valid_age, is_valid_guid, is_valid_incident_id
+
 logger = logging.getLogger()
 
+# The azure.kusto.data SDK, and pandas behind dataframe_from_result_table, are the slowest imports of the bot.
+# They are imported where they are used, so loading this module stays cheap and the SDK is loaded by
+# kustoclient.warm_up_async, or by the first query, once the bot is already listening.
+
+# Process wide cache of query results keyed on the template name and parameter values (the
+# query text for queries not run from a template), shared by every kustoclient.
+# Each kind of query keeps its answers for its own number of seconds.
+QUERY_CACHE_TTLS = {
+    'incidents': int(os.environ.get('KUSTO_CACHE_TTL_INCIDENTS', 60)),
+    'outages': int(os.environ.get('KUSTO_CACHE_TTL_OUTAGES', 60)),
+    'changes': int(os.environ.get('KUSTO_CACHE_TTL_CHANGES', 300)),
+    'incident': int(os.environ.get('KUSTO_CACHE_TTL_INCIDENT', 30)),
+    'trend': int(os.environ.get('KUSTO_CACHE_TTL_TREND', 300)),
+}
+query_cache = TTLCache(max_entries=int(os.environ.get('KUSTO_CACHE_SIZE', 256)))
+
+# Service Tree GUIDs whose changes are part of the situation report, and how many days of changes it shows.
+SITREP_SERVICE_TREE_GUIDS = [guid.strip() for guid in os.environ.get('SITREP_SERVICE_TREE_GUIDS', '').split(',') if guid.strip()]
+SITREP_CHANGES_AGE = int(os.environ.get('SITREP_CHANGES_AGE', 1))
+
+# Lists are shown PAGE_SIZE rows at a time. Each page is one query for the rows following the last row shown
+# (keyset paging on the order of the list), so a page costs the same whatever the size of the list.
+PAGE_SIZE = int(os.environ.get('KUSTO_PAGE_SIZE', 10))
+# Version of the cursors get_page returns; cursors of other versions start their list over.
+CURSOR_VERSION = 2
+# Format of the date of a page key, as sent to Kusto.
+KEY_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# Key of the first page: it sorts after every row of a list.
+FIRST_PAGE_KEY = ('9999-12-31T00:00:00.000000Z', '0')
+
+# After a conversation is shown a page of these lists, the histories of the incidents on it are fetched in one
+# background query and kept for KUSTO_PREFETCH_TTL seconds, so asking about one of them is answered at once.
+PREFETCHED_LISTS = ('incidents', 'outages')
+incident_prefetch = IncidentPrefetch()
+
+# What the user is told when a query was turned away by the scheduler and no cached answer was left.
+UNAVAILABLE_MESSAGE = "Kusto is overloaded right now ({}). Please try again in a minute.\r\n"
+
+def cache_stats():
+    return query_cache.stats()
+
+def scheduler_stats():
+    """
+    Queue depth, in flight queries, rejections and circuit state of every cluster queried so far.
+    """
+    return scheduler.stats()
+
+metrics.register_source('query_cache', cache_stats)
+metrics.register_source('scheduler', scheduler_stats)
+metrics.register_source('incident_prefetch', lambda: incident_prefetch.stats())
+
+# Lists shown page by page: the template listing their rows, how the rows are rendered and the date and id
+# columns the list is ordered on, newest first.
+PAGED_LISTS = {
+    'incidents': ('recent_incidents', RECENT_INCIDENTS, ('CreateDate', 'IncidentId')),
+    'outages': ('recent_outages', RECENT_OUTAGES, ('CreateDate', 'IncidentId')),
+    'changes': ('recent_changes', RECENT_CHANGES, ('TIMESTAMP', 'ChangeRecordId')),
+}
+
+def page_key(row, key_columns):
+    """
+    The position of a row in its paged list: its date, in KEY_DATE_FORMAT, and its id.
+    """
+    date_column, id_column = key_columns
+    return [getattr(row, date_column).astimezone(timezone.utc).strftime(KEY_DATE_FORMAT), str(getattr(row, id_column))]
+
+TREND_MAX_BINS = 48
+TREND_STEPS = (1, 3, 6, 12, 24, 72, 168)
+# Longest window the largest step splits into at most TREND_MAX_BINS bins; longer windows are shortened to it.
+TREND_MAX_DAYS = TREND_MAX_BINS * TREND_STEPS[-1] // 24
+
+def trend_step(age):
+    """
+    The smallest bin, in hours, that splits a window of age days, at most TREND_MAX_DAYS, into at most
+    TREND_MAX_BINS bins.
+    """
+    for step in TREND_STEPS:
+        if min(age, TREND_MAX_DAYS) * 24 / step <= TREND_MAX_BINS:
+            return step
+    return TREND_STEPS[-1]
+
+class QueryTemplate(object):
+    """
+    A KQL query whose variable parts are declared query parameters, sent to Kusto as ClientRequestProperties
+    parameters instead of being formatted into the text. Every call of a template sends the same query text,
+    so the cluster can reuse its query plan and serve repeated calls from its results cache, for up to
+    results_cache_max_age seconds.
+    parameters maps each parameter name to its Kusto type, in declaration order.
+    priority orders the template's queries in the cluster's admission queue, lowest first.
+    """
+
+    def __init__(self, name, text, kind, cluster, database, parameters=None, results_cache_max_age=None, priority=PRIORITY_LIST):
+        self.name = name
+        self.priority = priority
+        self.kind = kind
+        self.cluster = cluster
+        self.database = database
+        self.parameters = parameters or OrderedDict()
+        self.results_cache_max_age = results_cache_max_age
+        declaration = ", ".join("{}:{}".format(parameter, kusto_type) for parameter, kusto_type in self.parameters.items())
+        self.text = "declare query_parameters({});\n{}".format(declaration, text) if declaration else text
+
+    def properties(self, values, timeout):
+        from azure.kusto.data.request import ClientRequestProperties
+
+        properties = ClientRequestProperties()
+        # Let the cluster give up on the query at the same time the bot does.
+        properties.set_option(ClientRequestProperties.request_timeout_option_name, timedelta(seconds=timeout))
+        if self.results_cache_max_age:
+            properties.set_option('query_results_cache_max_age', str(timedelta(seconds=self.results_cache_max_age)))
+        for parameter, value in self.key(values):
+            properties.set_parameter(parameter, value)
+        return properties
+
+    def key(self, values):
+        """
+        The parameter values as strings, in declaration order; dynamic values are passed as JSON.
+        """
+        return tuple(
+            (parameter, json.dumps(values[parameter]) if kusto_type == 'dynamic' else str(values[parameter]))
+            for parameter, kusto_type in self.parameters.items()
+        )
+
+QUERY_TEMPLATES = {}
+
+def register_template(template):
+    QUERY_TEMPLATES[template.name] = template
+    return template
+
+register_template(QueryTemplate(
+    'recent_incidents',
+    'Incidents | where CreateDate > ago(1h) and Severity <= 2 | distinct CreateDate, IncidentId, Severity | where CreateDate < after_date or (CreateDate == after_date and IncidentId < after_id) | order by CreateDate desc, IncidentId desc | limit max_rows',
+    'incidents', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('after_date', 'datetime'), ('after_id', 'long'), ('max_rows', 'int')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['incidents']))
+register_template(QueryTemplate(
+    'recent_outages',
+    'Incidents | where CreateDate > ago(1h) and IsOutage | distinct CreateDate, IncidentId, Severity, OutageDeclaredDate | where CreateDate < after_date or (CreateDate == after_date and IncidentId < after_id) | order by CreateDate desc, IncidentId desc | limit max_rows',
+    'outages', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('after_date', 'datetime'), ('after_id', 'long'), ('max_rows', 'int')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['outages']))
+register_template(QueryTemplate(
+    'recent_changes',
+    'ChangeEvent | where ServiceTreeGuid == stguid and TIMESTAMP >= ago(age * 1d) | distinct TIMESTAMP, ChangeRecordId, Locations | where TIMESTAMP < after_date or (TIMESTAMP == after_date and strcmp(ChangeRecordId, after_id) < 0) | order by TIMESTAMP desc, ChangeRecordId desc | limit max_rows',
+    'changes', 'Fcmdata', 'FCMKustoStore',
+    parameters=OrderedDict([('stguid', 'string'), ('age', 'int'), ('after_date', 'datetime'), ('after_id', 'string'), ('max_rows', 'int')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['changes']))
+register_template(QueryTemplate(
+    'incident_history',
+    'Incidents | where IncidentId in (incidentids) | distinct ModifiedDate, IncidentId, Severity, Status | partition by IncidentId (top 10 by ModifiedDate desc) | order by IncidentId asc, ModifiedDate desc',
+    'incident', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('incidentids', 'dynamic')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['incident'],
+    priority=PRIORITY_LOOKUP))
+register_template(QueryTemplate(
+    'incident_trend',
+    'Incidents | where CreateDate > ago(window) | make-series Count = dcount(IncidentId) default=0 on CreateDate from ago(window) to now() step step by Severity',
+    'trend', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('window', 'timespan'), ('step', 'timespan')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['trend']))
+register_template(QueryTemplate(
+    'outage_trend',
+    'Incidents | where CreateDate > ago(window) and IsOutage | make-series Count = dcount(IncidentId) default=0 on CreateDate from ago(window) to now() step step by Severity',
+    'trend', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('window', 'timespan'), ('step', 'timespan')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['trend']))
+register_template(QueryTemplate(
+    'change_trend',
+    'ChangeEvent | where TIMESTAMP > ago(window) and ServiceTreeGuid == stguid | make-series Count = dcount(ChangeRecordId) default=0 on TIMESTAMP from ago(window) to now() step step by Locations',
+    'trend', 'Fcmdata', 'FCMKustoStore',
+    parameters=OrderedDict([('stguid', 'string'), ('window', 'timespan'), ('step', 'timespan')]),
+    results_cache_max_age=QUERY_CACHE_TTLS['trend']))
+register_template(QueryTemplate(
+    'incident_snapshot',
+    'Incidents | where CreateDate > ago(window) and ModifiedDate > since | summarize arg_max(ModifiedDate, CreateDate, Severity, IsOutage, OutageDeclaredDate) by IncidentId',
+    'incidents', 'Icmcluster', 'IcMDataWarehouse',
+    parameters=OrderedDict([('window', 'timespan'), ('since', 'datetime')]),
+    priority=PRIORITY_BACKGROUND))
+
+def iter_result_rows(table):
+    """
+    Yields the rows of a KustoResultTable as lightweight named tuples, without going through pandas.
+    """
+    Row = namedtuple('Row', [column.column_name for column in table.columns])
+    for row in table.rows:
+        yield Row._make(row.to_list())
+
 class StringBuilder(object):
     def __init__(self):
         self._stringio = io.StringIO()
@@ -29,113 +222,426 @@ class StringBuilder(object):
     def getValue(self):
         return self._stringio.getvalue()
 
-class kustoclient:
+class KustoConnectionManager(object):
+    """
+    Process wide pool holding one authenticated KustoClient per cluster.
+    Every kustoclient shares these clients, so each cluster is logged into once and its AAD token is
+    reused, and refreshed by the client, until it expires instead of being acquired again per query.
+    """
 
     def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, cluster):
+        with self._lock:
+            client = self._clients.get(cluster)
+            if client is None:
+                from azure.kusto.data.request import KustoClient
+
+                client = KustoClient(self._connection_string(cluster))
+                self._clients[cluster] = client
+            return client
+
+    def _connection_string(self, cluster):
+        from azure.kusto.data.request import KustoConnectionStringBuilder
+
+        kusto_link = "https://"+cluster+".kusto.windows.net"
+        if os.environ.get('KUSTO_AUTH_MODE', 'device') == 'application':
+            # For AAD App log into Kusto ...
+            return KustoConnectionStringBuilder.with_aad_application_key_authentication(
+                kusto_link, os.environ['KUSTO_CLIENT_ID'], os.environ['KUSTO_CLIENT_SECRET'], os.environ['KUSTO_AUTHORITY_ID'])
+        # For interactive log into Kusto ...
+        return KustoConnectionStringBuilder.with_aad_device_authentication(kusto_link)
+
+    def register_client(self, cluster, client):
+        """
+        Answers the queries of cluster with client, e.g. a stand-in from kusto_replay, instead of logging into Kusto.
+        """
+        with self._lock:
+            self._clients[cluster] = client
+
+    def execute_query(self, cluster, database, query, properties=None):
+        return self.get_client(cluster).execute_query(database, query, properties)
+
+def is_cluster_failure(error):
+    """
+    Whether a query's error says its cluster is throttling, failing or unreachable, and so counts against the
+    cluster's circuit breaker. An error Kusto answered with, e.g. a semantic error, means the cluster is up.
+    """
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+    if isinstance(error, (TimeoutError, ConnectionError, Timeout, RequestsConnectionError)):
+        return True
+    response = getattr(error, 'http_response', None)
+    status = getattr(response, 'status_code', getattr(response, 'status', None))
+    return type(error).__name__ == 'KustoThrottlingError' or status == 429 or (status is not None and status >= 500)
+
+connection_manager = KustoConnectionManager()
+# Every query goes through the admission queue of its cluster, see KUSTO_MAX_IN_FLIGHT and KUSTO_MAX_QUEUE.
+scheduler = KustoScheduler(is_failure=is_cluster_failure)
+
+class kustoclient:
+
+    def __init__(self, max_concurrency=None, query_timeout=None, admission_timeout=None):
         self.kusto_cluster = 'Icmcluster'
         self.kusto_database = 'IcMDataWarehouse'
         self.kusto_table = 'Incidents'
-        self.kusto_client = None
-        self.client_id = os.environ['KUSTO_CLIENT_ID']
-        self.client_secret = os.environ['KUSTO_CLIENT_SECRET']
-        self.authority_id = os.environ['KUSTO_AUTHORITY_ID']
-
-    def extractingKustoResponse(self, query = ""):
-        kusto_link = "https://"+self.kusto_cluster+".kusto.windows.net"
-        
-        # For interactive log into Kusto ...
-        KCSB = KustoConnectionStringBuilder.with_aad_device_authentication(kusto_link)
-        # For AAD App log into Kusto ...
-        # KCSB = KustoConnectionStringBuilder.with_aad_application_key_authentication(kusto_link, self.client_id, self.client_secret, self.authority_id)
-        if not isinstance(self.kusto_client, KustoClient):
-            self.kusto_client = KustoClient(KCSB)
+        # Threads available to the async API, and the number of seconds a single query may take before it is abandoned.
+        # The per cluster budget of the scheduler is what limits the queries sent to Kusto; the executor is
+        # larger so that a lookup can reach the admission queue while list queries hold the cluster's slots.
+        self.max_concurrency = int(max_concurrency or os.environ.get('KUSTO_MAX_CONCURRENCY', 16))
+        self.query_timeout = float(query_timeout or os.environ.get('KUSTO_QUERY_TIMEOUT', 30))
+        # Seconds a query may wait in its cluster's admission queue. It is kept well under query_timeout so a query
+        # that cannot get a slot is turned away, and answered from the cache, long before the bot gives up on it.
+        self.admission_timeout = float(admission_timeout or os.environ.get('KUSTO_ADMISSION_TIMEOUT', 5))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='kusto')
+        # Prefetches have threads of their own, so they never hold one a user's query is waiting for.
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('KUSTO_PREFETCH_CONCURRENCY', 2)), thread_name_prefix='kusto-prefetch')
+        self.poller = None
+
+    def extractingKustoResponse(self, query = "", cluster=None, database=None, properties=None, priority=PRIORITY_LIST):
+        """
+        Sends the query through the admission queue of its cluster.
+        Raises KustoUnavailableError when the queue is full, the query waited longer than admission_timeout for a
+        slot or the cluster's circuit is open; returns None when Kusto failed the query.
+        """
+        from azure.kusto.data.request import ClientRequestProperties
+        from azure.kusto.data.exceptions import KustoServiceError
+
+        if properties is None:
+            # Let the cluster give up on the query at the same time the bot does.
+            properties = ClientRequestProperties()
+            properties.set_option(ClientRequestProperties.request_timeout_option_name, timedelta(seconds=self.query_timeout))
+        cluster = cluster or self.kusto_cluster
+        database = database or self.kusto_database
 
         try:
-            response = self.kusto_client.execute_query(self.kusto_database, query)
+            response = scheduler.run(cluster, priority, lambda: self._execute(cluster, database, query, properties), self.admission_timeout)
             if response is not None:
                 return response
         except KustoServiceError as error:
+            metrics.count('kusto.errors')
             print("ERROR: ", error)
             traceback.print_exc()
 
-    def run_kusto_query(self, query):
+    def _execute(self, cluster, database, query, properties):
+        metrics.count('kusto.queries')
+        metrics.count('kusto.query_bytes', len(query))
+        with metrics.span('kusto.execute'):
+            return connection_manager.execute_query(cluster, database, query, properties)
+
+    def _fetch_kusto_rows(self, query, cluster=None, database=None, properties=None, priority=PRIORITY_LIST):
+        # Rows are read from the response as named tuples without pandas, and materialized because they are
+        # kept in the query cache and read again by later turns and conversations.
+        response = self.extractingKustoResponse(query, cluster, database, properties, priority)
+        if response is not None:
+            with metrics.span('kusto.materialize'):
+                rows = tuple(iter_result_rows(response.primary_results[0]))
+            metrics.count('kusto.rows', len(rows))
+            return rows
+
+    def run_template(self, name, cached=True, priority=None, **values):
+        """
+        Runs a registered query template with the given parameter values and returns the rows of its primary result.
+        Unless cached is False the rows are served from, and stored in, the shared query cache; when the cluster
+        turns the query away the last rows cached for it are returned even if they have expired.
+        The query can be queued at another priority than the template's.
+        """
+        template = QUERY_TEMPLATES[name]
+        logger.debug("template %s %s", template.name, values)
+        if not cached:
+            return self._fetch_template(template, values, priority)
+        key = ('rows', template.name, template.key(values))
+        try:
+            return query_cache.get_or_load(key, lambda: self._fetch_template(template, values, priority), QUERY_CACHE_TTLS[template.kind])
+        except KustoUnavailableError as error:
+            stale = query_cache.get_stale(key)
+            if stale is None:
+                raise
+            print("WARNING: serving cached {} rows, {}".format(template.name, error))
+            return stale
+
+    def _fetch_template(self, template, values, priority=None):
+        properties = template.properties(values, self.query_timeout)
+        priority = template.priority if priority is None else priority
+        return self._fetch_kusto_rows(template.text, template.cluster, template.database, properties, priority)
+
+    def run_kusto_query(self, query, kind=None, cluster=None, database=None):
+        """
+        Runs the query and returns its primary result as a DataFrame, for analytical queries that need pandas.
+        When a kind is given the result is served from, and stored in, the shared query cache.
+        """
+        if kind is None:
+            return self._run_kusto_query(query, cluster, database)
+        key = ('frame', cluster or self.kusto_cluster, database or self.kusto_database, query)
+        return query_cache.get_or_load(key, lambda: self._run_kusto_query(query, cluster, database), QUERY_CACHE_TTLS[kind])
+
+    def _run_kusto_query(self, query, cluster=None, database=None):
+        from azure.kusto.data.exceptions import KustoServiceError
+        from azure.kusto.data.helpers import dataframe_from_result_table
+
         try:
-            response = self.extractingKustoResponse(query)
+            response = self.extractingKustoResponse(query, cluster, database)
             if response is not None:
-                data = dataframe_from_result_table(response.primary_results[0])
+                with metrics.span('kusto.dataframe'):
+                    data = dataframe_from_result_table(response.primary_results[0])
+                metrics.count('kusto.rows', len(data))
                 return data
         except KustoServiceError as error:
             print("ERROR: ", error)
             traceback.print_exc()
 
+    # The first page of a list, without the "show more" footer: the situation report keeps no cursor.
     def get_recent_incidents(self):
-        #query = '''cluster(\'{0}\').database(\'{1}\').[\'{2}\'] | join kind=leftanti {3} on ConversationId, DocId | project ConversationId, DocId, Subject, Body_Text'''.format(self.kusto_cluster, self.kusto_database, self.kusto_table, self.kusto_summary_table)
-        query = '''cluster(\'{0}\').database(\'{1}\').[\'{2}\'] | where CreateDate > ago(1h) and Severity <= 2 | distinct CreateDate, IncidentId, Severity | order by CreateDate desc| limit 10'''.format(self.kusto_cluster, self.kusto_database, self.kusto_table)
-        print(query)
-        this_data = self.run_kusto_query(query)
-        if this_data is not None and len(this_data) > 0:
-            sb = StringBuilder()
-            for k, row in this_data.iterrows():
-                sb.append("CreateDate: " + row.CreateDate.strftime("%Y %m %d - %H:%M:%S.%f") + '\r\n')
-                sb.append("IncidentId: " + str(row.IncidentId) + '\r\n')
-                sb.append("Severity: " + str(row.Severity) + '\r\n')
-                sb.append("Link: " + "https://portal.microsofticm.com/imp/v3/incidents/details/"+str(row.IncidentId)+"/home"  + '\r\n')
-                sb.append('---------------------\r\n')
-            return (sb.getValue())
-        else:
-            return ""
+        return self.get_page('incidents', footer=False)[0]
 
     def get_recent_outages(self):
-        #query = '''cluster(\'{0}\').database(\'{1}\').[\'{2}\'] | join kind=leftanti {3} on ConversationId, DocId | project ConversationId, DocId, Subject, Body_Text'''.format(self.kusto_cluster, self.kusto_database, self.kusto_table, self.kusto_summary_table)
-        query = '''cluster(\'{0}\').database(\'{1}\').[\'{2}\'] | where CreateDate > ago(1h) and IsOutage | distinct CreateDate, IncidentId, Severity, OutageDeclaredDate | order by CreateDate desc| limit 10'''.format(self.kusto_cluster, self.kusto_database, self.kusto_table)
-        print(query)
-        this_data = self.run_kusto_query(query)
-        this_data = self.run_kusto_query(query)
-        if this_data is not None and len(this_data) > 0:
-            sb = StringBuilder()
-            for k, row in this_data.iterrows():
-                sb.append("CreateDate: " + row.CreateDate.strftime("%Y %m %d - %H:%M:%S.%f") + '\r\n')
-                sb.append("IncidentId: " + str(row.IncidentId) + '\r\n')
-                sb.append("Severity: " + str(row.Severity) + '\r\n')
-                sb.append("OutageDeclaredDate: " + str(row.OutageDeclaredDate) + '\r\n')
-                sb.append("Link: " + "https://portal.microsofticm.com/imp/v3/incidents/details/"+str(row.IncidentId)+"/home"  + '\r\n')
-                sb.append('---------------------\r\n')
-            return (sb.getValue())
-        else:
-            return ""
+        return self.get_page('outages', footer=False)[0]
     
     def get_recent_changes(self, stguid=None, age=1):
-        query = '''cluster(\'Fcmdata\').database(\'FCMKustoStore\').ChangeEvent | where ServiceTreeGuid == \'{0}\' and TIMESTAMP >= ago({1}d) | distinct TIMESTAMP, ChangeRecordId, Locations | limit 10 '''.format(stguid, age) 
-        print(query)
-        this_data = self.run_kusto_query(query)
-        this_data = self.run_kusto_query(query)
-        if this_data is not None and len(this_data) > 0:
-            sb = StringBuilder()
-            for k, row in this_data.iterrows():
-                sb.append("TIMESTAMP: " + row.TIMESTAMP.strftime("%Y %m %d - %H:%M:%S.%f") + '\r\n')
-                sb.append("ChangeRecordId: " + str(row.ChangeRecordId) + '\r\n')
-                sb.append("Locations: " + str(row.Locations) + '\r\n')
-                sb.append('---------------------\r\n')
-            return (sb.getValue())
+        return self.get_page('changes', footer=False, stguid=stguid, age=age)[0]
+
+    def list_rows(self, list_name, after=FIRST_PAGE_KEY, **values):
+        """
+        The PAGE_SIZE + 1 rows of a paged list following the row keyed after, newest first; the extra row tells
+        whether another page follows.
+        """
+        limit = PAGE_SIZE + 1
+        if self.poller is not None and self.poller.is_fresh():
+            after_date = datetime.strptime(after[0], KEY_DATE_FORMAT).replace(tzinfo=timezone.utc)
+            if list_name == 'incidents':
+                return tuple(self.poller.recent_incidents(limit=limit, after=(after_date, after[1])))
+            if list_name == 'outages':
+                return tuple(self.poller.recent_outages(limit=limit, after=(after_date, after[1])))
+        return self.run_template(PAGED_LISTS[list_name][0], after_date=after[0], after_id=after[1], max_rows=limit, **values)
+
+    def get_page(self, list_name, cursor=None, conversation_id=None, footer=True, **values):
+        """
+        Renders one page of a list and returns it with the cursor of the next page, or None on the last page.
+        The cursor holds the list, its parameter values, the number of rows shown and the key of the last one;
+        the next page is queried for the rows following that key, through the query cache.
+        With a conversation_id the histories of the incidents on a page of PREFETCHED_LISTS are prefetched for it.
+        Unless footer is False a page followed by others ends with how to ask for the next one.
+        """
+        start, after = 0, FIRST_PAGE_KEY
+        if cursor is not None:
+            list_name, values = cursor["list"], cursor["values"]
+            if cursor.get("v") == CURSOR_VERSION:
+                start, after = cursor["offset"], tuple(cursor["last"])
+        # Malformed input never costs a cluster round trip.
+        if list_name == 'changes':
+            if not is_valid_guid(values.get('stguid')):
+                return "{} is not a valid Service Tree GUID.".format(values.get('stguid')), None
+            if not is_valid_age(values.get('age')):
+                return "{} is not a valid number of days.".format(values.get('age')), None
+            values = dict(values, age=int(values['age']))
+        _, schema, key_columns = PAGED_LISTS[list_name]
+
+        rows = self.list_rows(list_name, after, **values)
+        if rows is None:
+            return "", None
+
+        page = rows[:PAGE_SIZE]
+        if conversation_id is not None and list_name in PREFETCHED_LISTS:
+            self.prefetch_incidents(conversation_id, [row.IncidentId for row in page])
+        with metrics.span('render'):
+            text = render_rows(page, schema)
+        if len(rows) <= PAGE_SIZE or not footer:
+            return text, None
+        next_cursor = {
+            "v": CURSOR_VERSION, "list": list_name, "values": values,
+            "offset": start + PAGE_SIZE, "last": page_key(page[-1], key_columns),
+        }
+        more = "Showing {} to {}. Say \"show more\" for the next page.\r\n".format(start + 1, start + PAGE_SIZE)
+        return text + more, next_cursor
+
+    def prefetch_incidents(self, conversation_id, incidentids):
+        """
+        Fetches the histories of the incidents in one background query, behind the queries users wait for,
+        and keeps them for the conversation. Incidents already kept for it are not fetched again, and
+        conversations shown the same page share the query through the query cache. No more than
+        KUSTO_PREFETCH_MAX_PENDING batches wait for the executor; lists shown meanwhile are not prefetched.
+        """
+        missing = incident_prefetch.reserve(conversation_id, incidentids)
+        if missing:
+            self._prefetch_executor.submit(self._prefetch_incidents, conversation_id, missing)
+
+    def _prefetch_incidents(self, conversation_id, incidentids):
+        if incident_prefetch.expired(conversation_id):
+            # Queued past the conversation's histories: nobody can look them up any more.
+            incident_prefetch.drop(conversation_id, incidentids)
+            return
+        rows = None
+        try:
+            rows = self.run_template('incident_history', priority=PRIORITY_BACKGROUND, incidentids=[int(i) for i in incidentids])
+        except Exception as error:
+            print("ERROR: incident prefetch failed: ", error)
+        incident_prefetch.fill(conversation_id, incidentids, rows)
+
+    def get_incident(self, incidentid=None, conversation_id=None):
+        """
+        Shows the recent history of one incident, or of each of a collection of incidents looked up in one query.
+        With a conversation_id, histories prefetched for it are shown without querying Kusto; a prefetch not
+        done within KUSTO_PREFETCH_WAIT seconds is not waited for.
+        """
+        if incidentid is None or isinstance(incidentid, (str, int)):
+            incidentids = [incidentid]
         else:
+            incidentids = list(incidentid)
+        invalid = [i for i in incidentids if not is_valid_incident_id(i)]
+        if not incidentids or invalid:
+            return "{} is not a valid IncidentId.".format(", ".join(str(i) for i in invalid or [None]))
+        # Histories are keyed by the IncidentId as text, whichever type it was given as.
+        incidentids = list(dict.fromkeys(str(i) for i in incidentids))
+        history = None
+        if conversation_id is not None:
+            history = incident_prefetch.get(conversation_id, incidentids)
+        if history is None:
+            # IncidentId is a long, so the ids are sent as numbers like after_id of the incident lists.
+            this_data = self.run_template('incident_history', incidentids=[int(i) for i in incidentids])
+            if this_data is None:
+                return ""
+            history = {}
+            for row in this_data:
+                history.setdefault(str(row.IncidentId), []).append(row)
+
+        # One section per incident, in the order they were asked for.
+        with metrics.span('render'):
+            return "".join(render_rows(history.get(i, []), INCIDENT_HISTORY) for i in incidentids)
+
+    def get_incident_trend(self, age=7):
+        return self._get_trend('incident_trend', 'Incidents', 'Severity', age)
+
+    def get_outage_trend(self, age=7):
+        return self._get_trend('outage_trend', 'Outages', 'Severity', age)
+
+    def get_change_trend(self, stguid=None, age=7):
+        if not is_valid_guid(stguid):
+            return "{} is not a valid Service Tree GUID.".format(stguid)
+        return self._get_trend('change_trend', 'Changes', 'Locations', age, stguid=stguid)
+
+    def _get_trend(self, name, title, series_column, age, **values):
+        """
+        Counts are aggregated by Kusto into at most TREND_MAX_BINS bins per series, so the answer stays a few
+        hundred bytes whatever the window. Windows longer than TREND_MAX_DAYS are shortened to it.
+        """
+        if not is_valid_age(age):
+            return "{} is not a valid number of days.".format(age)
+        age = min(int(age), TREND_MAX_DAYS)
+        step = trend_step(age)
+        this_data = self.run_template(name, window='{}d'.format(age), step='{}h'.format(step), **values)
+        if not this_data:
             return ""
+        with metrics.span('render'):
+            return "{} per {}h over the last {} days:\r\n".format(title, step, age) + render_trend(this_data, series_column)
 
-    def get_incident(self, incidentid=None):
-        query = '''cluster(\'{0}\').database(\'{1}\').[\'{2}\'] | where IncidentId==\'{3}\' | distinct ModifiedDate, IncidentId, Severity, Status | order by ModifiedDate desc | limit 10'''.format(self.kusto_cluster, self.kusto_database, self.kusto_table, incidentid)
-        print(query)
-        this_data = self.run_kusto_query(query)
-        if this_data is not None and len(this_data) > 0:
-            sb = StringBuilder()
-            for k, row in this_data.iterrows():
-                sb.append("ModifiedDate: " + row.ModifiedDate.strftime("%Y %m %d - %H:%M:%S.%f") + '\r\n')
-                sb.append("IncidentId: " + str(row.IncidentId) + '\r\n')
-                sb.append("Severity: " + str(row.Severity) + '\r\n')
-                sb.append("Status: " + str(row.Status) + '\r\n')
-                sb.append('---------------------\r\n')
-            sb.append("Link: " + "https://portal.microsofticm.com/imp/v3/incidents/details/"+str(row.IncidentId)+"/home"  + '\r\n')
-            return (sb.getValue())
-        else:
+    async def _run_async(self, func, *args, **kwargs):
+        """
+        Runs one of the blocking get_* methods on the bounded Kusto executor so the bot's event loop keeps serving
+        other conversations while the query is in flight.
+        A query the scheduler turned away is answered with UNAVAILABLE_MESSAGE right away. The call is abandoned
+        once it could have waited admission_timeout for a slot and run query_timeout.
+        """
+        loop = asyncio.get_event_loop()
+        call = functools.partial(func, *args, **kwargs)
+        timeout = self.admission_timeout + self.query_timeout
+        try:
+            with metrics.span('kusto.call'):
+                return await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout)
+        except asyncio.TimeoutError:
+            metrics.count('kusto.timeouts')
+            print("ERROR: Kusto query timed out after {} seconds".format(timeout))
             return ""
+        except KustoUnavailableError as error:
+            print("ERROR: Kusto query rejected: ", error)
+            return UNAVAILABLE_MESSAGE.format(error)
+
+    async def run_template_async(self, name, **values):
+        """
+        Runs a registered query template, uncached, on the Kusto executor.
+        Returns its rows, or None when it failed or timed out.
+        """
+        rows = await self._run_async(self.run_template, name, cached=False, **values)
+        return rows if isinstance(rows, tuple) else None
+
+    def warm_up(self):
+        """
+        Imports the Kusto SDK and creates the clients of the clusters the templates query, ahead of the first turn.
+        """
+        for cluster in sorted({template.cluster for template in QUERY_TEMPLATES.values()}):
+            connection_manager.get_client(cluster)
+
+    async def warm_up_async(self):
+        """
+        Runs warm_up on the Kusto executor and starts the poller. Meant to be scheduled once the bot is listening,
+        so the first conversation does not pay for them.
+        """
+        with metrics.span('warm_up'):
+            await asyncio.get_event_loop().run_in_executor(self._executor, self.warm_up)
+        self.start_poller()
+
+    def start_poller(self):
+        """
+        Starts keeping the snapshot of recent incidents and outages the get_recent_* methods answer from.
+        Must be called on the bot's running event loop; calling it again does nothing.
+        Setting INCIDENT_POLL_INTERVAL to 0 turns the poller off.
+        """
+        if self.poller is None and float(os.environ.get('INCIDENT_POLL_INTERVAL', 30)) > 0:
+            self.poller = IncidentPoller(self)
+            self.poller.start()
+            metrics.register_source('poller', self.poller.stats)
+
+    async def get_page_async(self, list_name, cursor=None, conversation_id=None, **values):
+        answer = await self._run_async(self.get_page, list_name, cursor, conversation_id, **values)
+        # A timed out page has no next page.
+        return answer if isinstance(answer, tuple) else (answer, None)
+
+    async def get_recent_incidents_async(self):
+        return await self._run_async(self.get_recent_incidents)
+
+    async def get_recent_outages_async(self):
+        return await self._run_async(self.get_recent_outages)
+
+    async def get_recent_changes_async(self, stguid=None, age=1):
+        return await self._run_async(self.get_recent_changes, stguid=stguid, age=age)
+
+    async def get_incident_async(self, incidentid=None, conversation_id=None):
+        # incidentid is one IncidentId or a collection of them.
+        return await self._run_async(self.get_incident, incidentid=incidentid, conversation_id=conversation_id)
+
+    async def get_incident_trend_async(self, age=7):
+        return await self._run_async(self.get_incident_trend, age=age)
+
+    async def get_outage_trend_async(self, age=7):
+        return await self._run_async(self.get_outage_trend, age=age)
+
+    async def get_change_trend_async(self, stguid=None, age=7):
+        return await self._run_async(self.get_change_trend, stguid=stguid, age=age)
+
+    async def get_situation_report_async(self, stguids=None, age=None):
+        """
+        Runs the recent incidents, recent outages and recent changes queries concurrently and merges their
+        answers into one message, so the report takes as long as its slowest query.
+        """
+        stguids = SITREP_SERVICE_TREE_GUIDS if stguids is None else stguids
+        age = SITREP_CHANGES_AGE if age is None else age
+        sections = [
+            ("Recent incidents", self.get_recent_incidents_async()),
+            ("Recent outages", self.get_recent_outages_async()),
+        ]
+        for stguid in stguids:
+            sections.append(
+                ("Changes for {} in the last {} days".format(stguid, age), self.get_recent_changes_async(stguid=stguid, age=age))
+            )
+        answers = await asyncio.gather(*(query for title, query in sections))
+
+        sb = StringBuilder()
+        for (title, query), answer in zip(sections, answers):
+            sb.append("**" + title + "**\r\n")
+            sb.append(answer or "None\r\n")
+        return sb.getValue()
 
 '''
 
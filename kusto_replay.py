@@ -0,0 +1,244 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from helpers.kusto_helper import QUERY_TEMPLATES, connection_manager
+
+
+class ReplayColumn(object):
+    def __init__(self, column_name):
+        self.column_name = column_name
+
+
+class ReplayRow(object):
+    def __init__(self, values):
+        self._values = values
+
+    def to_list(self):
+        return list(self._values)
+
+
+class ReplayTable(object):
+    """
+    The part of a KustoResultTable the helpers read: column names and rows with to_list().
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = [ReplayColumn(column) for column in columns]
+        self.rows = [ReplayRow(row) for row in rows]
+
+
+class ReplayResponse(object):
+    def __init__(self, table):
+        self.primary_results = [table]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError("{!r} cannot be recorded".format(value))
+
+
+def _decode(value):
+    if "$datetime" in value:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+
+def query_parameters(properties):
+    return json.loads(properties.to_json())["Parameters"] if properties is not None else {}
+
+
+def recording_key(database, query, properties):
+    return json.dumps([database, query, sorted(query_parameters(properties).items())])
+
+
+class RecordingKustoClient(object):
+    """
+    Wraps a KustoClient and records the primary result of every query it runs; save() writes them as JSON
+    for ReplayKustoClient.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self._recordings = {}
+        self._lock = threading.Lock()
+
+    def execute_query(self, database, query, properties=None):
+        response = self.client.execute_query(database, query, properties)
+        table = response.primary_results[0]
+        with self._lock:
+            self._recordings[recording_key(database, query, properties)] = {
+                "columns": [column.column_name for column in table.columns],
+                "rows": [row.to_list() for row in table.rows],
+            }
+        return response
+
+    def save(self):
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as recording_file:
+                json.dump(self._recordings, recording_file, default=_encode)
+
+
+class ReplayKustoClient(object):
+    """
+    Stand-in for KustoClient answering from recorded results, or from a SyntheticIcm for queries that were
+    not recorded. Every query sleeps latency seconds, give or take jitter (a fraction of latency), in the
+    calling thread like a real round trip.
+    """
+
+    def __init__(self, recordings=None, synthetic=None, latency=0.0, jitter=0.0, seed=None):
+        self.recordings = recordings or {}
+        self.synthetic = synthetic
+        self.latency = latency
+        self.jitter = jitter
+        self.queries = 0
+        self._random = random.Random(seed)
+        self._templates = {template.text: template for template in QUERY_TEMPLATES.values()}
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as recording_file:
+            return cls(recordings=json.load(recording_file, object_hook=_decode), **kwargs)
+
+    def execute_query(self, database, query, properties=None):
+        self.queries += 1
+        if self.latency:
+            time.sleep(max(0.0, self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))))
+
+        recorded = self.recordings.get(recording_key(database, query, properties))
+        if recorded is not None:
+            return ReplayResponse(ReplayTable(recorded["columns"], recorded["rows"]))
+        template = self._templates.get(query)
+        if template is None or self.synthetic is None:
+            raise KeyError("no recorded or synthetic result for query {!r}".format(query[:80]))
+        columns, rows = self.synthetic.table(template, query_parameters(properties))
+        return ReplayResponse(ReplayTable(columns, rows))
+
+
+def install(client, clusters=None):
+    """
+    Makes client answer the queries of the given clusters, by default every cluster a template queries.
+    """
+    for cluster in clusters or {template.cluster for template in QUERY_TEMPLATES.values()}:
+        connection_manager.register_client(cluster, client)
+
+
+class SyntheticIcm(object):
+    """
+    Made up but consistent incidents and changes, created in the last two days, to answer every query template.
+    """
+
+    def __init__(self, incidents=2000, changes=500, seed=0):
+        generator = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.incidents = []
+        for index in range(incidents):
+            create_date = now - timedelta(seconds=generator.uniform(0, 2 * 86400))
+            outage = generator.random() < 0.1
+            self.incidents.append({
+                "IncidentId": 180000000 + index,
+                "CreateDate": create_date,
+                "ModifiedDate": create_date + timedelta(minutes=generator.uniform(0, 60)),
+                "Severity": generator.choice((1, 2, 2, 3, 3, 3, 4)),
+                "IsOutage": outage,
+                "OutageDeclaredDate": create_date + timedelta(minutes=5) if outage else None,
+                "Status": generator.choice(("Active", "Mitigated", "Resolved")),
+            })
+        self.incidents.sort(key=lambda incident: (incident["CreateDate"], incident["IncidentId"]), reverse=True)
+        self.by_id = {incident["IncidentId"]: incident for incident in self.incidents}
+        self.changes = sorted(
+            ({
+                "TIMESTAMP": now - timedelta(seconds=generator.uniform(0, 2 * 86400)),
+                "ChangeRecordId": "CR{}".format(500000 + index),
+                "Locations": generator.choice(("West US", "East US", "North Europe", "Southeast Asia")),
+            } for index in range(changes)),
+            key=lambda change: (change["TIMESTAMP"], change["ChangeRecordId"]), reverse=True)
+
+    def table(self, template, parameters):
+        return getattr(self, "_" + template.name)(parameters)
+
+    def _recent(self, predicate, columns, parameters):
+        horizon = datetime.now(timezone.utc) - timedelta(hours=1)
+        after = _after(parameters, int)
+        rows = [[incident[column] for column in columns]
+                for incident in self.incidents if incident["CreateDate"] > horizon and predicate(incident)
+                and (after is None or (incident["CreateDate"], incident["IncidentId"]) < after)]
+        return columns, rows[:int(parameters.get("max_rows", len(rows)))]
+
+    def _recent_incidents(self, parameters):
+        return self._recent(lambda incident: incident["Severity"] <= 2, ["CreateDate", "IncidentId", "Severity"], parameters)
+
+    def _recent_outages(self, parameters):
+        return self._recent(lambda incident: incident["IsOutage"], ["CreateDate", "IncidentId", "Severity", "OutageDeclaredDate"], parameters)
+
+    def _recent_changes(self, parameters):
+        columns = ["TIMESTAMP", "ChangeRecordId", "Locations"]
+        horizon = datetime.now(timezone.utc) - timedelta(days=int(parameters.get("age", 1)))
+        after = _after(parameters, str)
+        rows = [[change[column] for column in columns] for change in self.changes if change["TIMESTAMP"] >= horizon
+                and (after is None or (change["TIMESTAMP"], change["ChangeRecordId"]) < after)]
+        return columns, rows[:int(parameters.get("max_rows", len(rows)))]
+
+    def _incident_history(self, parameters):
+        columns = ["ModifiedDate", "IncidentId", "Severity", "Status"]
+        rows = []
+        for incidentid in sorted(int(i) for i in json.loads(parameters.get("incidentids", "[]"))):
+            incident = self.by_id.get(incidentid)
+            if incident is not None:
+                rows.extend([incident["ModifiedDate"] - timedelta(minutes=10 * step), incidentid, incident["Severity"], incident["Status"]]
+                            for step in range(3))
+        return columns, rows
+
+    def _series(self, items, date_column, series_column, parameters):
+        window = _timespan(parameters["window"])
+        step = _timespan(parameters["step"])
+        start = datetime.now(timezone.utc) - window
+        bins = max(1, int(window / step))
+        series = {}
+        for item in items:
+            if item[date_column] >= start:
+                counts = series.setdefault(item[series_column], [0] * bins)
+                counts[min(bins - 1, int((item[date_column] - start) / step))] += 1
+        timestamps = [start + step * index for index in range(bins)]
+        return [series_column, date_column, "Count"], [[key, timestamps, counts] for key, counts in sorted(series.items())]
+
+    def _incident_trend(self, parameters):
+        return self._series(self.incidents, "CreateDate", "Severity", parameters)
+
+    def _outage_trend(self, parameters):
+        return self._series([incident for incident in self.incidents if incident["IsOutage"]], "CreateDate", "Severity", parameters)
+
+    def _change_trend(self, parameters):
+        return self._series(self.changes, "TIMESTAMP", "Locations", parameters)
+
+    def _incident_snapshot(self, parameters):
+        columns = ["IncidentId", "ModifiedDate", "CreateDate", "Severity", "IsOutage", "OutageDeclaredDate"]
+        horizon = datetime.now(timezone.utc) - _timespan(parameters["window"])
+        since = _datetime(parameters["since"])
+        return columns, [[incident[column] for column in columns] for incident in self.incidents
+                         if incident["CreateDate"] > horizon and incident["ModifiedDate"] > since]
+
+
+def _after(parameters, id_type):
+    """
+    The (date, id) key of the keyset paged templates, or None when the query has none.
+    """
+    if "after_date" not in parameters:
+        return None
+    return _datetime(parameters["after_date"]), id_type(parameters["after_id"])
+
+
+def _datetime(text):
+    return datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+
+def _timespan(text):
+    """
+    Reads the '12h', '7d' or '120m' timespans the templates are called with.
+    """
+    unit = {"m": "minutes", "h": "hours", "d": "days"}[text[-1]]
+    return timedelta(**{unit: float(text[:-1])})
@@ -0,0 +1,211 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Lower runs first: single incident lookups go ahead of list queries, which go ahead of background polls.
+PRIORITY_LOOKUP = 0
+PRIORITY_LIST = 1
+PRIORITY_BACKGROUND = 2
+
+
+class KustoUnavailableError(Exception):
+    """
+    A query was not sent to Kusto because its cluster is overloaded or failing.
+    """
+
+
+class KustoRejectedError(KustoUnavailableError):
+    pass
+
+
+class CircuitOpenError(KustoUnavailableError):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Opens when at least failure_ratio of the calls of the last window seconds failed (and there were at
+    least min_calls of them). While open every call fails fast; after cooldown seconds one probe call is let
+    through and its outcome closes or reopens the circuit. Calls admitted before the circuit opened that
+    complete while it is open or half open are not counted.
+    """
+
+    def __init__(self, failure_ratio=0.5, min_calls=5, window=30, cooldown=30):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._opened_at = None
+        self._probing = False
+        self._outcomes = deque()
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def cancel_probe(self):
+        """
+        Gives back the probe allow() let through when it was not sent after all, so the next call probes instead.
+        """
+        if self.state == "half_open":
+            self._probing = False
+
+    def record(self, success, probe=False):
+        now = time.monotonic()
+        if self.state != "closed" and not probe:
+            return
+        if self.state == "half_open":
+            self._probing = False
+            if success:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._open(now)
+            return
+
+        self._outcomes.append((now, success))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+            self._open(now)
+
+    def _open(self, now):
+        self.state = "open"
+        self._opened_at = now
+        self._outcomes.clear()
+
+
+class ClusterScheduler(object):
+    """
+    Admission control for one cluster: at most max_in_flight queries run at once, up to max_queue more
+    wait for a slot in priority order, and anything beyond that is rejected. is_failure tells which errors
+    of a call count against the circuit breaker, by default all of them; the others are raised without being
+    counted as failed.
+    """
+
+    def __init__(self, max_in_flight, max_queue, breaker=None, is_failure=None):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.breaker = breaker or CircuitBreaker()
+        self.is_failure = is_failure or (lambda error: True)
+        self.in_flight = 0
+        self.rejected = 0
+        self.circuit_rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def run(self, priority, call, timeout=None):
+        probe = self._acquire(priority, timeout)
+        success = False
+        try:
+            result = call()
+            success = True
+            return result
+        except Exception as error:
+            success = not self.is_failure(error)
+            raise
+        finally:
+            self._release(success, probe)
+
+    def _acquire(self, priority, timeout):
+        """
+        Takes a slot, and returns whether the call is the probe of a half open circuit.
+        """
+        with self._condition:
+            if not self.breaker.allow():
+                self.circuit_rejected += 1
+                raise CircuitOpenError("circuit open")
+            # In half_open the call let through is the probe; if it is turned away it must give the probe back.
+            probe = self.breaker.state == "half_open"
+            if self.in_flight < self.max_in_flight and not self._queue:
+                self.in_flight += 1
+                return probe
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                if probe:
+                    self.breaker.cancel_probe()
+                raise KustoRejectedError("{} queries already waiting".format(len(self._queue)))
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._queue[0] != ticket or self.in_flight >= self.max_in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self.rejected += 1
+                    if probe:
+                        self.breaker.cancel_probe()
+                    self._condition.notify_all()
+                    raise KustoRejectedError("waited {} seconds for a slot".format(timeout))
+                self._condition.wait(remaining)
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            self._condition.notify_all()
+            return probe
+
+    def _release(self, success, probe):
+        with self._condition:
+            self.in_flight -= 1
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.breaker.record(success, probe)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "rejected": self.rejected,
+                "circuit_rejected": self.circuit_rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "circuit": self.breaker.state,
+            }
+
+
+class KustoScheduler(object):
+    """
+    One ClusterScheduler per cluster, created on first use.
+    """
+
+    def __init__(self, max_in_flight=None, max_queue=None, is_failure=None):
+        self.max_in_flight = int(max_in_flight or os.environ.get('KUSTO_MAX_IN_FLIGHT', 4))
+        self.max_queue = int(max_queue or os.environ.get('KUSTO_MAX_QUEUE', 32))
+        self.is_failure = is_failure
+        self._clusters = {}
+        self._lock = threading.Lock()
+
+    def cluster(self, cluster):
+        with self._lock:
+            scheduler = self._clusters.get(cluster)
+            if scheduler is None:
+                scheduler = ClusterScheduler(self.max_in_flight, self.max_queue, is_failure=self.is_failure)
+                self._clusters[cluster] = scheduler
+            return scheduler
+
+    def run(self, cluster, priority, call, timeout=None):
+        return self.cluster(cluster).run(priority, call, timeout)
+
+    def stats(self):
+        with self._lock:
+            clusters = dict(self._clusters)
+        return {cluster: scheduler.stats() for cluster, scheduler in clusters.items()}
@@ -0,0 +1,123 @@
+import json
+import math
+import re
+from collections import Counter
+
+from botbuilder.core import IntentScore, RecognizerResult
+
+# Words, GUIDs and numbers as they appear in the utterances.
+_TOKEN = re.compile(r"[0-9a-f]+(?:-[0-9a-f]+){4}|\d+|[^\W\d_]+", re.IGNORECASE)
+_GUID = re.compile(r"^[0-9a-f]+(?:-[0-9a-f]+){4}$", re.IGNORECASE)
+
+
+def _tokens(text: str) -> list:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if _GUID.match(token):
+            tokens.append("<guid>")
+        elif token.isdigit():
+            tokens.append("<num>")
+        else:
+            tokens.append(token)
+    return tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+
+
+def _span_pattern(text: str) -> str:
+    """
+    Turns a labelled entity span into a pattern matching spans of the same shape,
+    e.g. "15 days" matches any number of days and a GUID matches any GUID.
+    """
+    parts = []
+    for token in _TOKEN.findall(text):
+        if _GUID.match(token):
+            parts.append("-".join("[0-9a-f]{%d}" % len(part) for part in token.split("-")))
+        elif token.isdigit():
+            parts.append(r"\d+")
+        else:
+            parts.append(re.escape(token.lower()))
+    return r"\b" + r"\s*".join(parts) + r"\b"
+
+
+class LocalRecognizer:
+    """
+    In-process stand-in for the LUIS app, trained from its exported definition (IncidentLookup.json).
+    Intents are scored by TF-IDF cosine similarity to the labelled utterances and entities are found by
+    matching spans shaped like the labelled ones.
+    """
+
+    def __init__(self, app_definition: dict):
+        self.version = app_definition.get("versionId")
+        self._examples = []
+        document_frequency = Counter()
+        span_patterns = {}
+
+        utterances = app_definition.get("utterances", [])
+        for utterance in utterances:
+            counts = Counter(_tokens(utterance["text"]))
+            document_frequency.update(counts.keys())
+            self._examples.append((utterance["intent"], counts))
+            for entity in utterance.get("entities", []):
+                span = utterance["text"][entity["startPos"]:entity["endPos"] + 1]
+                span_patterns.setdefault(entity["entity"], set()).add(_span_pattern(span))
+
+        self._idf = {
+            token: math.log((1 + len(utterances)) / (1 + frequency)) + 1
+            for token, frequency in document_frequency.items()
+        }
+        self._unseen_idf = math.log(1 + len(utterances)) + 1
+        self._examples = [(intent, self._vector(counts)) for intent, counts in self._examples]
+        self._entities = [
+            (name, re.compile("|".join(sorted(patterns)), re.IGNORECASE))
+            for name, patterns in sorted(span_patterns.items())
+        ]
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalRecognizer":
+        with open(path, encoding="utf-8-sig") as app_file:
+            return cls(json.load(app_file))
+
+    def recognize_text(self, text: str) -> RecognizerResult:
+        """
+        Returns a RecognizerResult shaped like the one LuisRecognizer produces, holding only the top intent.
+        """
+        text = text or ""
+        vector = self._vector(Counter(_tokens(text)))
+        intent, score = "None", 0.0
+        for example_intent, example in self._examples:
+            similarity = sum(weight * example.get(token, 0.0) for token, weight in vector.items())
+            if similarity > score:
+                intent, score = example_intent, similarity
+
+        return RecognizerResult(
+            text=text,
+            altered_text=None,
+            intents={intent: IntentScore(score=score)},
+            entities=self._match_entities(text),
+        )
+
+    def _vector(self, counts: Counter) -> dict:
+        vector = {
+            token: count * self._idf.get(token, self._unseen_idf)
+            for token, count in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {token: weight / norm for token, weight in vector.items()}
+
+    def _match_entities(self, text: str) -> dict:
+        matches = []
+        for name, pattern in self._entities:
+            for match in pattern.finditer(text):
+                matches.append((match.start(), -match.end(), name, match.group(0)))
+
+        # Keep the longest of overlapping spans, the way LUIS never labels one character twice.
+        entities = {"$instance": {}}
+        end = 0
+        for start, negative_end, name, span in sorted(matches):
+            if start < end:
+                continue
+            end = -negative_end
+            entities.setdefault(name, []).append(span)
+            entities["$instance"].setdefault(name, []).append(
+                {"startIndex": start, "endIndex": end, "text": span, "type": name, "score": 1.0}
+            )
+        return entities
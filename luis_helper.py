@@ -3,10 +3,127 @@
 from enum import Enum
 from typing import Dict
 from botbuilder.ai.luis import LuisRecognizer
-from botbuilder.core import IntentScore, TopIntent, TurnContext
-import sys, json
+from botbuilder.core import IntentScore, RecognizerResult, TopIntent, TurnContext
+import sys, json, os, re
+import logging
 
 from showlist_details import ShowListDetails
+from helpers.local_recognizer import LocalRecognizer
+from helpers.metrics import metrics
+from helpers.pattern_extractor import extract_show_list, is_complete
+from helpers.ttl_cache import TTLCache
+
+logger = logging.getLogger()
+
+# Utterances the local recognizer scores at least this high are answered without calling LUIS.
+LOCAL_RECOGNIZER_THRESHOLD = float(os.environ.get("LOCAL_RECOGNIZER_THRESHOLD", 0.5))
+# Fully specified requests recognized at least this confidently are answered without asking for a confirmation.
+CONFIRM_SKIP_THRESHOLD = float(os.environ.get("CONFIRM_SKIP_THRESHOLD", 0.8))
+# Window of a trend when the utterance does not give one.
+TREND_DEFAULT_DAYS = 7
+# A ShowList answer is only usable when it names one of these lists.
+LIST_ENTITIES = ("incidents", "outages", "changes", "incident", "report", "more")
+
+
+def _load_local_recognizer():
+    path = os.environ.get(
+        "LUIS_APP_DEFINITION", os.path.join(os.path.dirname(os.path.abspath(__file__)), "IncidentLookup.json")
+    )
+    if not os.path.exists(path):
+        logger.warning("LUIS app definition %s not found, the local recognizer is disabled", path)
+        return None
+    return LocalRecognizer.from_file(path)
+
+
+local_recognizer = _load_local_recognizer()
+# Number of turns served by each recognizer.
+recognizer_stats = {"pattern": 0, "cache": 0, "local": 0, "luis": 0}
+
+# LUIS answers are memoized per normalized utterance. Cached answers belong to the app version
+# that produced them, so publishing a new version starts from an empty cache.
+LUIS_APP_VERSION = os.environ.get("LUIS_APP_VERSION") or (
+    local_recognizer.version if local_recognizer is not None else None
+)
+luis_cache = TTLCache(
+    max_entries=int(os.environ.get("LUIS_CACHE_SIZE", 512)),
+    default_ttl=int(os.environ.get("LUIS_CACHE_TTL", 3600)),
+)
+metrics.register_source("recognizer", lambda: dict(recognizer_stats))
+metrics.register_source("luis_cache", luis_cache.stats)
+
+_GUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+_NUMBER = re.compile(r"\d+")
+_PLACEHOLDER = re.compile(r"^<(guid|num)(\d+)>$")
+
+
+def normalize_utterance(text: str) -> (str, dict):
+    """
+    Collapses the whitespace of the utterance, replaces GUIDs and numbers by placeholders and lower cases it.
+    Returns the normalized utterance and the replaced values, as typed, in order of appearance.
+    """
+    text = " ".join((text or "").split())
+    values = {"guid": _GUID.findall(text)}
+    text = _GUID.sub("<guid>", text)
+    values["num"] = _NUMBER.findall(text)
+    return _NUMBER.sub("<num>", text).lower(), values
+
+
+def _to_placeholder(value, values: dict):
+    if value is None:
+        return None
+    for kind, found in values.items():
+        found = [item.lower() for item in found]
+        if str(value).lower() in found:
+            return "<{}{}>".format(kind, found.index(str(value).lower()))
+    return value
+
+
+def _from_placeholder(value, values: dict):
+    match = _PLACEHOLDER.match(value) if isinstance(value, str) else None
+    if match is None:
+        return value
+    found = values[match.group(1)]
+    index = int(match.group(2))
+    return found[index] if index < len(found) else None
+
+
+def _make_template(result: ShowListDetails, values: dict) -> ShowListDetails:
+    if result is None:
+        return None
+    return ShowListDetails(
+        alist=result.alist,
+        guid=_to_placeholder(result.guid, values),
+        age=_to_placeholder(result.age, values),
+        unsupported_list=list(result.unsupported_list),
+        incidentids=[_to_placeholder(incidentid, values) for incidentid in result.incidentids],
+        trend=result.trend,
+        score=result.score,
+    )
+
+
+def _is_cacheable(template: ShowListDetails) -> bool:
+    # A value LUIS did not take verbatim from the utterance cannot be substituted on a later hit.
+    if template is None:
+        return True
+    return all(
+        value is None or _PLACEHOLDER.match(str(value))
+        for value in [template.guid, template.age] + template.incidentids
+    )
+
+
+def _fill_template(template: ShowListDetails, values: dict) -> ShowListDetails:
+    if template is None:
+        return None
+    age = _from_placeholder(template.age, values)
+    return ShowListDetails(
+        alist=template.alist,
+        guid=_from_placeholder(template.guid, values),
+        age=int(age) if age is not None else None,
+        unsupported_list=list(template.unsupported_list),
+        incidentids=[_from_placeholder(incidentid, values) for incidentid in template.incidentids],
+        trend=template.trend,
+        score=template.score,
+    )
 
 
 class Intent(Enum):
@@ -22,12 +139,58 @@ def top_intent(intents: Dict[Intent, dict]) -> TopIntent:
         intent_score = IntentScore(value)
         if intent_score.score > max_value:
             max_intent, max_value = intent, intent_score.score
-            print("max_intent: {}, max_value: {}".format(max_intent, max_value))
+            logger.debug("max_intent: %s, max_value: %s", max_intent, max_value)
 
     return TopIntent(max_intent, max_value)
 
 
 class LuisHelper:
+    @staticmethod
+    async def recognize(
+        luis_recognizer: LuisRecognizer, turn_context: TurnContext
+    ) -> (RecognizerResult, str):
+        """
+        Recognizes the turn with the local recognizer when it is confident enough, otherwise with LUIS.
+        Returns the recognizer result and the name of the path that served it.
+        """
+        if local_recognizer is not None:
+            with metrics.span("luis.local"):
+                recognizer_result = local_recognizer.recognize_text(turn_context.activity.text)
+            intent, score = next(iter(recognizer_result.intents.items()))
+            if (
+                intent == Intent.SHOW_LIST.value
+                and score.score >= LOCAL_RECOGNIZER_THRESHOLD
+                and any(name in recognizer_result.entities for name in LIST_ENTITIES)
+            ):
+                return recognizer_result, "local"
+
+        with metrics.span("luis.remote"):
+            return await luis_recognizer.recognize(turn_context), "luis"
+
+    @staticmethod
+    async def recognize_memoized(
+        luis_recognizer: LuisRecognizer, turn_context: TurnContext
+    ) -> (Intent, object, str):
+        """
+        Serves the turn from the memoized LUIS answers when its normalized utterance was seen before,
+        otherwise recognizes it and memoizes what LUIS answered.
+        """
+        utterance, values = normalize_utterance(turn_context.activity.text)
+        cache_key = (LUIS_APP_VERSION, utterance)
+        cached = luis_cache.get(cache_key)
+        if cached is not None:
+            intent, template = cached
+            return intent, _fill_template(template, values), "cache"
+
+        recognizer_result, source = await LuisHelper.recognize(
+            luis_recognizer, turn_context
+        )
+        intent, result = LuisHelper.show_list_details(recognizer_result)
+        template = _make_template(result, values)
+        if source == "luis" and _is_cacheable(template):
+            luis_cache.put(cache_key, (intent, template))
+        return intent, result, source
+
     @staticmethod
     async def execute_luis_query(
         luis_recognizer: LuisRecognizer, turn_context: TurnContext
@@ -39,80 +202,141 @@ class LuisHelper:
         intent = None
 
         try:
-            recognizer_result = await luis_recognizer.recognize(turn_context)
-
-            intent = (
-                sorted(
-                    recognizer_result.intents,
-                    key=recognizer_result.intents.get,
-                    reverse=True,
-                )[:1][0]
-                if recognizer_result.intents
-                else None
+            # Messages fully determined by their pattern never need a recognizer.
+            with metrics.span("luis.pattern"):
+                result = extract_show_list(turn_context.activity.text)
+            if result is not None:
+                intent, source = Intent.SHOW_LIST.value, "pattern"
+            else:
+                with metrics.span("luis.recognize"):
+                    intent, result, source = await LuisHelper.recognize_memoized(
+                        luis_recognizer, turn_context
+                    )
+            recognizer_stats[source] += 1
+            logger.debug("recognizer: %s", source)
+
+        except Exception as exception:
+            print(exception)
+
+        logger.debug("intent: %s", intent)
+        if result is not None:
+            logger.debug("result: %s, %s, %s", result.alist, result.guid, result.age)
+
+        return intent, result
+
+    @staticmethod
+    def needs_confirmation(result: ShowListDetails) -> bool:
+        """
+        A request is confirmed with the user unless it is fully specified and its intent was recognized
+        with a score of at least CONFIRM_SKIP_THRESHOLD.
+        """
+        return not (is_complete(result) and (result.score or 0.0) >= CONFIRM_SKIP_THRESHOLD)
+
+    @staticmethod
+    def show_list_details(recognizer_result: RecognizerResult) -> (Intent, object):
+        """
+        Turns a recognizer result into the top intent and, for ShowList, the details it names.
+        """
+        result = None
+        intent = (
+            sorted(
+                recognizer_result.intents,
+                key=lambda name: recognizer_result.intents[name].score or 0.0,
+                reverse=True,
+            )[:1][0]
+            if recognizer_result.intents
+            else None
+        )
+        
+        if intent == Intent.SHOW_LIST.value:
+            result = ShowListDetails(score=recognizer_result.intents[intent].score)
+
+            # We need to get the result from the LUIS JSON which at every level returns an array.
+            # incidents
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "incidents", []
             )
-            
-            if intent == Intent.SHOW_LIST.value:
-                result = ShowListDetails()
-
-                # We need to get the result from the LUIS JSON which at every level returns an array.
-                # incidents
-                alist = recognizer_result.entities.get("$instance", {}).get(
-                    "incidents", []
-                )
-                if len(alist) > 0:
-                    result.alist = alist[0]["text"].capitalize()
+            if len(alist) > 0:
+                result.alist = alist[0]["text"].capitalize()
 
-                # outages
-                alist = recognizer_result.entities.get("$instance", {}).get(
-                "outages", []
+            # outages
+            alist = recognizer_result.entities.get("$instance", {}).get(
+            "outages", []
+            )
+            if len(alist) > 0:
+                result.alist = alist[0]["text"].capitalize()
+
+            # changes
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "changes", []
+            )
+            if len(alist) > 0:
+                result.alist = alist[0]["text"].capitalize()
+
+                blist = recognizer_result.entities.get("$instance", {}).get(
+                "stguid", []
+                )
+                if len(blist) > 0:
+                    result.guid = blist[0]["text"].replace(" ", "")
+                
+                blist = recognizer_result.entities.get("$instance", {}).get(
+                "changesage", []
                 )
-                if len(alist) > 0:
-                    result.alist = alist[0]["text"].capitalize()
+                if len(blist) > 0:
+                    result.age = int(''.join(c for c in blist[0]["text"] if c.isdigit()))
+                logger.debug("Changes entry: %s, %s, %s", result.alist, result.guid, result.age)
 
-                # changes
-                alist = recognizer_result.entities.get("$instance", {}).get(
-                    "changes", []
+            # incident
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "incident", []
+            )
+            if len(alist) > 0:
+                result.alist = alist[0]["text"].capitalize()
+
+                blist = recognizer_result.entities.get("$instance", {}).get(
+                "incidentid", []
                 )
-                if len(alist) > 0:
-                    result.alist = alist[0]["text"].capitalize()
+                # Every incident asked about is looked up in one batch.
+                result.incidentids = [b["text"].replace(" ", "") for b in blist]
+                
+                logger.debug("Incident entry: %s, %s", result.alist, result.incidentids)
 
-                    blist = recognizer_result.entities.get("$instance", {}).get(
-                    "stguid", []
-                    )
-                    if len(blist) > 0:
-                        result.guid = blist[0]["text"].replace(" ", "")
-                    
-                    blist = recognizer_result.entities.get("$instance", {}).get(
-                    "changesage", []
-                    )
-                    if len(blist) > 0:
-                        result.age = int(''.join(c for c in blist[0]["text"] if c.isdigit()))
-                    print("Changes entry: {}, {}, {}".format(result.alist, result.guid, result.age))
+            # trend of incidents, outages or changes
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "trend", []
+            )
+            if len(alist) > 0 and result.alist in ("Incidents", "Outages", "Changes"):
+                result.trend = True
 
-                # incident
-                alist = recognizer_result.entities.get("$instance", {}).get(
-                    "incident", []
+                # A day count can be labelled as either age entity.
+                blist = recognizer_result.entities.get("$instance", {}).get(
+                "trendage", []
+                ) or recognizer_result.entities.get("$instance", {}).get(
+                "changesage", []
                 )
-                if len(alist) > 0:
-                    result.alist = alist[0]["text"].capitalize()
+                if len(blist) > 0:
+                    result.age = int(''.join(c for c in blist[0]["text"] if c.isdigit()))
+                if result.age is None:
+                    result.age = TREND_DEFAULT_DAYS
+                logger.debug("Trend entry: %s, %s, %s", result.alist, result.guid, result.age)
 
-                    blist = recognizer_result.entities.get("$instance", {}).get(
-                    "incidentid", []
-                    )
-                    if len(blist) > 0:
-                        result.incidentid = blist[0]["text"].replace(" ", "")
-                    
-                    print("Changes entry: {}, {}, {}".format(result.alist, result.incidentid))
-
-                if not result.alist:
-                    result.unsupported_list.append(
-                        alist[0]["text"].capitalize()
-                    )
+            # situation report
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "report", []
+            )
+            if len(alist) > 0:
+                result.alist = "Report"
 
-        except Exception as exception:
-            print(exception)
+            # next page of the last list
+            alist = recognizer_result.entities.get("$instance", {}).get(
+                "more", []
+            )
+            if len(alist) > 0 and not result.alist:
+                result.alist = "More"
 
-        print("intent: {}".format(intent))
-        print("result: {}, {}, {}".format(result.alist, result.guid, result.age))
+            if not result.alist and len(alist) > 0:
+                result.unsupported_list.append(
+                    alist[0]["text"].capitalize()
+                )
 
         return intent, result
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import threading
+
+from botbuilder.core import IntentScore, RecognizerResult, TurnContext
+
+from helpers.local_recognizer import LocalRecognizer
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _to_result(text: str, answer: dict) -> RecognizerResult:
+    return RecognizerResult(
+        text=text,
+        altered_text=None,
+        intents={intent: IntentScore(score=score) for intent, score in answer["intents"].items()},
+        entities=answer["entities"],
+    )
+
+
+class RecordingLuisRecognizer:
+    """
+    Wraps the bot's LUIS recognizer and records the intents and entities of every utterance it recognizes;
+    save() writes them as JSON for ReplayLuisRecognizer.
+    """
+
+    def __init__(self, recognizer, path: str):
+        self.recognizer = recognizer
+        self.path = path
+        self._recordings = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_configured(self) -> bool:
+        return self.recognizer.is_configured
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        result = await self.recognizer.recognize(turn_context)
+        with self._lock:
+            self._recordings[_normalize(turn_context.activity.text)] = {
+                "intents": {intent: score.score for intent, score in result.intents.items()},
+                "entities": result.entities,
+            }
+        return result
+
+    def save(self):
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as recording_file:
+                json.dump(self._recordings, recording_file)
+
+
+class ReplayLuisRecognizer:
+    """
+    Stand-in for the bot's LUIS recognizer that needs no LUIS app. Recorded utterances get their recorded
+    answer, the labelled utterances of the app definition get their labels (as a trained LUIS app would)
+    and anything else is scored by a LocalRecognizer trained from the same definition.
+    Every call waits latency seconds, like a round trip to the LUIS endpoint.
+    """
+
+    def __init__(self, app_definition: dict, recordings: dict = None, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._local = LocalRecognizer(app_definition)
+        self._answers = {}
+        for utterance in app_definition.get("utterances", []):
+            text = utterance["text"]
+            entities = {"$instance": {}}
+            for entity in utterance.get("entities", []):
+                span = text[entity["startPos"]:entity["endPos"] + 1]
+                entities.setdefault(entity["entity"], []).append(span)
+                entities["$instance"].setdefault(entity["entity"], []).append({
+                    "startIndex": entity["startPos"], "endIndex": entity["endPos"] + 1,
+                    "text": span, "type": entity["entity"], "score": 1.0,
+                })
+            self._answers[_normalize(text)] = {"intents": {utterance["intent"]: 1.0}, "entities": entities}
+        self._answers.update(recordings or {})
+
+    @classmethod
+    def from_files(cls, app_definition_path: str, recordings_path: str = None, latency: float = 0.0):
+        with open(app_definition_path, encoding="utf-8-sig") as app_file:
+            app_definition = json.load(app_file)
+        recordings = None
+        if recordings_path is not None:
+            with open(recordings_path, encoding="utf-8") as recording_file:
+                recordings = json.load(recording_file)
+        return cls(app_definition, recordings, latency)
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = turn_context.activity.text
+        answer = self._answers.get(_normalize(text))
+        if answer is not None:
+            return _to_result(text, answer)
+        return self._local.recognize_text(text)
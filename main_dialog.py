@@ -1,6 +1,8 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import asyncio
+
 from botbuilder.dialogs import (
     ComponentDialog,
     WaterfallDialog,
@@ -14,9 +16,11 @@ from botbuilder.schema import InputHints
 from showlist_details import ShowListDetails
 from luis_app_recognizer import LuisAppRecognizer
 from helpers.luis_helper import LuisHelper, Intent
+from helpers.pattern_extractor import is_complete
 from .showlist_dialog import ShowListDialog
 
 import helpers.kusto_helper as kusto_helper
+from helpers.metrics import metrics
 
 class MainDialog(ComponentDialog):
     def __init__(
@@ -37,10 +41,34 @@ class MainDialog(ComponentDialog):
 
         self.initial_dialog_id = "WFDialog"
 
-        self.kc = kusto_helper.kustoclient()
+        self._kc = None
+
+    @property
+    def kc(self) -> kusto_helper.kustoclient:
+        # Created on first use, so building the dialog reads no Kusto settings.
+        if self._kc is None:
+            self._kc = kusto_helper.kustoclient()
+        return self._kc
 
+    async def warm_up(self) -> None:
+        """
+        Loads the Kusto SDK, creates its clients and starts the incident poller. Schedule it from the app's
+        on_startup handler with asyncio.ensure_future so it runs while the bot is already listening.
+        """
+        await self.kc.warm_up_async()
 
     async def intro_step(self, step_context: WaterfallStepContext) -> DialogTurnResult:
+        # Keep the snapshot of recent incidents warm from the first turn on.
+        self.kc.start_poller()
+
+        options = (
+            step_context.options
+            if isinstance(step_context.options, dict)
+            else {"prompt": step_context.options}
+        )
+        # The cursor of the last list shown, kept in dialog state for "show more".
+        step_context.values["cursor"] = options.get("cursor")
+
         if not self._luis_recognizer.is_configured:
             await step_context.context.send_activity(
                 MessageFactory.text(
@@ -52,8 +80,8 @@ class MainDialog(ComponentDialog):
 
             return await step_context.next(None)
         message_text = (
-            str(step_context.options)
-            if step_context.options
+            str(options["prompt"])
+            if options.get("prompt")
             else "Hi, I am DRI BOT. What can I help you with today?"
         )
         prompt_message = MessageFactory.text(
@@ -68,22 +96,37 @@ class MainDialog(ComponentDialog):
         if not self._luis_recognizer.is_configured:
             # LUIS is not configured.
             return await step_context.begin_dialog(
-                self._showlist_dialog_id, ShowListDetails()
+                self._showlist_dialog_id, ShowListDetails().to_state()
             )
 
         # Call LUIS and gather any potential details. (Note the TurnContext has the response to the prompt.)
-        intent, luis_result = await LuisHelper.execute_luis_query(
-            self._luis_recognizer, step_context.context
-        )
+        with metrics.span("turn.luis"):
+            intent, luis_result = await LuisHelper.execute_luis_query(
+                self._luis_recognizer, step_context.context
+            )
+
+        if intent == Intent.SHOW_LIST.value and luis_result and luis_result.alist == "More":
+            # The next page of the last list needs no confirmation.
+            await self._show_more(step_context)
 
-        if intent == Intent.SHOW_LIST.value and luis_result:
+        elif intent == Intent.SHOW_LIST.value and luis_result:
             # Show a warning for list if we can't resolve them.
             await MainDialog._show_warning_for_unsupported_list(
                 step_context.context, luis_result
             )
 
-            # Run the ShowListDialog giving it whatever details we have from the LUIS call.
-            return await step_context.begin_dialog(self._showlist_dialog_id, luis_result)
+            if not LuisHelper.needs_confirmation(luis_result):
+                # Fully specified and confidently recognized: answer right away, without the confirmation turn.
+                metrics.count("turn.confirm_skipped")
+                return await step_context.next(luis_result)
+
+            if is_complete(luis_result):
+                # Start the query while the user confirms, so the answer is read from the query cache.
+                self._prefetch(luis_result)
+
+            # Run the ShowListDialog giving it whatever details we have from the LUIS call,
+            # kept in its dialog state in the compact form of ShowListDetails.to_state.
+            return await step_context.begin_dialog(self._showlist_dialog_id, luis_result.to_state())
 
         else:
             didnt_understand_text = (
@@ -102,21 +145,87 @@ class MainDialog(ComponentDialog):
         if step_context.result is not None:
             result = step_context.result
             
-            kustoRet = ""
-            if "incidents" in result.alist.lower():
-                kustoRet = self.kc.get_recent_incidents()
-            elif "outages" in result.alist.lower():
-                kustoRet = self.kc.get_recent_outages()
-            elif "changes" in result.alist.lower():
-                kustoRet = self.kc.get_recent_changes(stguid=result.guid, age=result.age)
-            elif "incident" in result.alist.lower():
-                kustoRet = self.kc.get_incident(incidentid=result.incidentid)
-            msg_txt = f"I am showing you a list of {result.alist} as below:\r\n {kustoRet}"
-            message = MessageFactory.text(msg_txt, msg_txt, InputHints.ignoring_input)
-            await step_context.context.send_activity(message)
+            stage = "trend" if result.trend else self._list_name(result) or "unknown"
+            with metrics.span("turn.query." + stage):
+                kustoRet, cursor, list_name = await self._run_query(result, step_context.context.activity.conversation.id)
+            if not result.trend and list_name in kusto_helper.PAGED_LISTS:
+                # A new list replaces the cursor of the last one.
+                step_context.values["cursor"] = cursor
+            await self._send_answer(
+                step_context, f"I am showing you a list of {result.alist} as below:\r\n {kustoRet}"
+            )
 
         prompt_message = "What else can I do for you?"
-        return await step_context.replace_dialog(self.id, prompt_message)
+        return await step_context.replace_dialog(
+            self.id, {"prompt": prompt_message, "cursor": step_context.values.get("cursor")}
+        )
+
+    async def _run_query(self, result: ShowListDetails, conversation_id: str = None) -> (str, dict, str):
+        """
+        Runs the query the details ask for. Returns its answer, for paged lists the cursor of the next page, and
+        the name of the list it queried, one of incidents, outages, changes, incident and report, or None.
+        Given the conversation, the incidents it is shown are prefetched for it and its incident lookups use them.
+        """
+        kustoRet, cursor = "", None
+        list_name = self._list_name(result)
+        if result.trend and list_name == "incidents":
+            kustoRet = await self.kc.get_incident_trend_async(age=result.age)
+        elif result.trend and list_name == "outages":
+            kustoRet = await self.kc.get_outage_trend_async(age=result.age)
+        elif result.trend and list_name == "changes":
+            kustoRet = await self.kc.get_change_trend_async(stguid=result.guid, age=result.age)
+        elif list_name in ("incidents", "outages"):
+            kustoRet, cursor = await self.kc.get_page_async(list_name, conversation_id=conversation_id)
+        elif list_name == "changes":
+            kustoRet, cursor = await self.kc.get_page_async(
+                "changes", stguid=result.guid, age=result.age
+            )
+        elif list_name == "incident":
+            kustoRet = await self.kc.get_incident_async(
+                incidentid=result.incidentids, conversation_id=conversation_id
+            )
+        elif list_name == "report":
+            kustoRet = await self.kc.get_situation_report_async()
+        return kustoRet, cursor, list_name
+
+    @staticmethod
+    def _list_name(result: ShowListDetails) -> str:
+        """
+        The list the details ask for, matched in the order the names contain one another.
+        """
+        alist = (result.alist or "").lower()
+        for list_name in ("incidents", "outages", "changes", "incident", "report"):
+            if list_name in alist:
+                return list_name
+        return None
+
+    def _prefetch(self, result: ShowListDetails) -> None:
+        async def prefetch():
+            try:
+                await self._run_query(result)
+            except Exception as error:
+                print("ERROR: prefetch failed: ", error)
+
+        metrics.count("turn.prefetched")
+        asyncio.ensure_future(prefetch())
+
+    async def _send_answer(self, step_context: WaterfallStepContext, msg_txt: str) -> None:
+        metrics.count("turn.answers")
+        metrics.count("turn.answer_bytes", len(msg_txt.encode("utf-8")))
+        message = MessageFactory.text(msg_txt, msg_txt, InputHints.ignoring_input)
+        with metrics.span("turn.send"):
+            await step_context.context.send_activity(message)
+
+    async def _show_more(self, step_context: WaterfallStepContext) -> None:
+        cursor = step_context.values.get("cursor")
+        if cursor is None:
+            msg_txt = "There is nothing more to show."
+        else:
+            kustoRet, step_context.values["cursor"] = await self.kc.get_page_async(
+                cursor["list"], cursor, conversation_id=step_context.context.activity.conversation.id
+            )
+            msg_txt = f"I am showing you more {cursor['list']} as below:\r\n {kustoRet}"
+        await self._send_answer(step_context, msg_txt)
 
     @staticmethod
     async def _show_warning_for_unsupported_list(
@@ -0,0 +1,153 @@
+import json
+import os
+import random
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; the last bucket takes everything slower.
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"))
+
+
+class Histogram(object):
+    """
+    Latency distribution of one stage in fixed buckets. Percentiles are the upper bound of the bucket holding them.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = 0
+        while value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+        }
+
+
+class _Span(object):
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Metrics(object):
+    """
+    Process wide timing spans, per stage latency histograms and counters.
+    Only a sample_rate fraction of the spans is timed (METRICS_SAMPLE_RATE, 1 by default, 0 turns timing off);
+    counters are always kept. Other components register a stats function whose answer is part of snapshot().
+    """
+
+    def __init__(self, sample_rate=None):
+        self.sample_rate = float(os.environ.get("METRICS_SAMPLE_RATE", 1) if sample_rate is None else sample_rate)
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage):
+        """
+        Context manager timing the block it wraps into the histogram of stage.
+        """
+        if self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return _Span(self, stage)
+        return _NO_SPAN
+
+    def observe(self, stage, milliseconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(milliseconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_source(self, name, stats):
+        self._sources[name] = stats
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "uptime_seconds": time.time() - self.started,
+                "sample_rate": self.sample_rate,
+                "latency": {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+        for name, stats in self._sources.items():
+            try:
+                snapshot[name] = stats()
+            except Exception as error:
+                snapshot[name] = {"error": str(error)}
+        return snapshot
+
+    def dump(self):
+        return json.dumps(self.snapshot(), indent=2, default=str)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+metrics = Metrics()
+
+
+async def metrics_handler(request):
+    """
+    aiohttp handler serving the metrics snapshot as JSON, e.g. app.router.add_get("/api/metrics", metrics_handler).
+    """
+    from aiohttp import web
+
+    return web.Response(text=metrics.dump(), content_type="application/json")
+
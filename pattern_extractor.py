@@ -0,0 +1,98 @@
+import re
+
+from showlist_details import ShowListDetails
+
+INCIDENT_ID = re.compile(r"^\d{6,12}$")
+SERVICE_TREE_GUID = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
+)
+
+_INCIDENT = re.compile(
+    # Only numbers shaped like an IncidentId; "incidents 10" is left to the recognizers.
+    r"\bincidents?\s*(?:ids?\s*)?#?\s*(\d{6,12}(?:(?:\s*(?:,|and|&)\s*|\s+)#?\d{6,12})*)\b", re.IGNORECASE
+)
+_NUMBER = re.compile(r"\d+")
+_GUID = re.compile(
+    r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE
+)
+_DAYS = re.compile(r"\b(\d+)\s*days?\b", re.IGNORECASE)
+# Words naming one of the other lists make a message ambiguous for the fast path.
+_LISTS = re.compile(r"\b(?:incidents|outages|changes?)\b", re.IGNORECASE)
+_MORE = re.compile(r"^\s*(?:(?:show|give)\s+(?:me\s+)?)?(?:more|next(?:\s+page)?)\s*(?:please)?[.!]?\s*$", re.IGNORECASE)
+# Trends are left to the recognizers.
+_TREND = re.compile(r"\b(?:trends?|how many)\b", re.IGNORECASE)
+# The only words a message answered by its pattern may have besides its values; with any other word, or a
+# number left over, the message says more than the pattern captures and is left to the recognizers.
+_FILLER = frozenset("""
+    please can could you i want to show me give get look lookup up find check the a an all of for on about in
+    over last past recent list details detail info information history status what whats is are help with and
+    service tree guid stguid id ids change changes incident
+""".split())
+_WORD = re.compile(r"\w+")
+
+
+def is_valid_incident_id(incidentid) -> bool:
+    return incidentid is not None and INCIDENT_ID.match(str(incidentid)) is not None
+
+
+def is_valid_guid(guid) -> bool:
+    return guid is not None and SERVICE_TREE_GUID.match(str(guid)) is not None
+
+
+def is_valid_age(age) -> bool:
+    try:
+        return int(age) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def is_complete(details: ShowListDetails) -> bool:
+    """
+    Whether the details name a list and every value its query needs is valid, so it can run as is.
+    """
+    if details is None or not details.alist or details.unsupported_list:
+        return False
+    alist = details.alist.lower()
+    if alist == "changes":
+        return is_valid_guid(details.guid) and is_valid_age(details.age)
+    if alist == "incident":
+        return bool(details.incidentids) and all(is_valid_incident_id(i) for i in details.incidentids)
+    if details.trend:
+        return is_valid_age(details.age)
+    return alist in ("incidents", "outages", "report")
+
+
+def _is_filler(text: str) -> bool:
+    return all(word.lower() in _FILLER for word in _WORD.findall(text))
+
+
+def extract_show_list(text: str) -> ShowListDetails:
+    """
+    Returns the ShowListDetails of a message that is fully determined by its pattern, or None.
+    "incident 123456789" (or "incidents 123456789, 987654321") asks for incidents by ID and a
+    Service Tree GUID plus "3 days" asks for changes. "show more" asks for the next page of the last list.
+    Apart from these, the message may only have _FILLER words.
+    """
+    text = text or ""
+    if _MORE.match(text):
+        return ShowListDetails(alist="More", score=1.0)
+    if _TREND.search(text):
+        return None
+    lists = {word.lower() for word in _LISTS.findall(text)}
+
+    incidents = list(_INCIDENT.finditer(text))
+    if incidents:
+        rest = _INCIDENT.sub(" ", text)
+        if not _LISTS.search(rest) and _is_filler(rest):
+            incidentids = [incidentid for incident in incidents for incidentid in _NUMBER.findall(incident.group(1))]
+            return ShowListDetails(alist="Incident", incidentids=list(dict.fromkeys(incidentids)), score=1.0)
+        return None
+
+    guid = _GUID.search(text)
+    days = _DAYS.search(text)
+    if guid is not None and days is not None and lists <= {"change", "changes"}:
+        rest = _DAYS.sub(" ", _GUID.sub(" ", text))
+        if _is_filler(rest):
+            return ShowListDetails(alist="Changes", guid=guid.group(0), age=int(days.group(1)), score=1.0)
+
+    return None
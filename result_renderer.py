@@ -0,0 +1,136 @@
+from helpers.string_builder import StringBuilder
+
+DATE_FORMAT = "%Y %m %d - %H:%M:%S.%f"
+ICM_LINK = "https://portal.microsofticm.com/imp/v3/incidents/details/{}/home"
+SEPARATOR = '---------------------\r\n'
+SPARK_BARS = "\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+
+
+class Column(object):
+    """
+    One "Label: value" line of a rendered row.
+    Dates are formatted with date_format, other values with formatter (str when not given).
+    """
+
+    def __init__(self, name, label=None, date_format=None, formatter=None):
+        self.name = name
+        self.label = label or name
+        self.date_format = date_format
+        self.formatter = formatter
+
+    def format_value(self, value):
+        if self.date_format is not None:
+            return value.strftime(self.date_format)
+        if self.formatter is not None:
+            return self.formatter(value)
+        return str(value)
+
+    def format_series(self, series):
+        # The whole column of a DataFrame at once, for render_frame.
+        if self.date_format is not None:
+            return series.dt.strftime(self.date_format)
+        if self.formatter is not None:
+            return series.map(self.formatter)
+        return series.astype(str)
+
+
+class ResultSchema(object):
+    """
+    Describes how the rows of a query result are rendered for the bot.
+    link is a template with one {} for the value of link_column. The link is added to every row,
+    or once after the last row when link_per_row is False.
+    """
+
+    def __init__(self, columns, link=None, link_column='IncidentId', link_per_row=True):
+        self.columns = columns
+        self.link = link
+        self.link_column = link_column
+        self.link_per_row = link_per_row
+
+
+RECENT_INCIDENTS = ResultSchema(
+    [Column('CreateDate', date_format=DATE_FORMAT), Column('IncidentId'), Column('Severity')],
+    link=ICM_LINK,
+)
+RECENT_OUTAGES = ResultSchema(
+    [Column('CreateDate', date_format=DATE_FORMAT), Column('IncidentId'), Column('Severity'), Column('OutageDeclaredDate')],
+    link=ICM_LINK,
+)
+RECENT_CHANGES = ResultSchema(
+    [Column('TIMESTAMP', date_format=DATE_FORMAT), Column('ChangeRecordId'), Column('Locations')],
+)
+INCIDENT_HISTORY = ResultSchema(
+    [Column('ModifiedDate', date_format=DATE_FORMAT), Column('IncidentId'), Column('Severity'), Column('Status')],
+    link=ICM_LINK,
+    link_per_row=False,
+)
+
+
+def render_frame(frame, schema):
+    """
+    Renders a DataFrame as the Markdown text the bot sends, formatting a whole column at a time
+    instead of walking the rows. Returns "" for an empty or missing frame.
+    This is the renderer of kustoclient.run_kusto_query's frames (and the baseline of render_benchmark);
+    the bot's own queries return rows and are rendered by render_rows.
+    """
+    if frame is None or len(frame) == 0:
+        return ""
+
+    lines = None
+    for column in schema.columns:
+        line = column.label + ": " + column.format_series(frame[column.name]) + '\r\n'
+        lines = line if lines is None else lines + line
+    if schema.link is not None and schema.link_per_row:
+        prefix, suffix = schema.link.split("{}")
+        lines = lines + "Link: " + prefix + frame[schema.link_column].astype(str) + suffix + '\r\n'
+    text = "".join((lines + SEPARATOR).tolist())
+
+    if schema.link is not None and not schema.link_per_row:
+        text += "Link: " + schema.link.format(frame[schema.link_column].iloc[-1]) + '\r\n'
+    return text
+
+
+def render_rows(rows, schema):
+    """
+    Renders rows as the Markdown text the bot sends, consuming them one at a time so a generator of
+    named tuples (or any objects with the schema's column attributes) never has to be materialized.
+    Returns "" when there are no rows.
+    """
+    sb = StringBuilder()
+    row = None
+    for row in rows:
+        for column in schema.columns:
+            sb.append(column.label + ": " + column.format_value(getattr(row, column.name)) + '\r\n')
+        if schema.link is not None and schema.link_per_row:
+            sb.append("Link: " + schema.link.format(getattr(row, schema.link_column)) + '\r\n')
+        sb.append(SEPARATOR)
+
+    if row is not None and schema.link is not None and not schema.link_per_row:
+        sb.append("Link: " + schema.link.format(getattr(row, schema.link_column)) + '\r\n')
+    return sb.getValue()
+
+
+def sparkline(values):
+    """
+    Draws a series of counts as one bar character per bin, scaled to the series peak.
+    """
+    peak = max(values) if values else 0
+    if not peak:
+        return SPARK_BARS[0] * len(values)
+    return "".join(SPARK_BARS[int(value * (len(SPARK_BARS) - 1) / peak)] for value in values)
+
+
+def render_trend(rows, series_column, value_column='Count', max_series=10):
+    """
+    Renders make-series rows (one array of counts per series) as one sparkline line per series,
+    busiest series first. Returns "" when there are no rows.
+    """
+    series = sorted(rows, key=lambda row: sum(getattr(row, value_column)), reverse=True)
+    sb = StringBuilder()
+    for row in series[:max_series]:
+        values = getattr(row, value_column)
+        sb.append("{} {}: {} total {}, peak {}\r\n".format(
+            series_column, getattr(row, series_column), sparkline(values), sum(values), max(values)))
+    if len(series) > max_series:
+        sb.append("... and {} more\r\n".format(len(series) - max_series))
+    return sb.getValue()
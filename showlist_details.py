@@ -1,20 +1,83 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+# Version of the list to_state returns; from_state reads this version only.
+STATE_VERSION = 1
+
 
 class ShowListDetails:
+    __slots__ = ("alist", "guid", "_age", "incidentids", "unsupported_list", "trend", "score")
+
     def __init__(
         self,
         alist: str = None,
         guid: str = None,
-        age: str = None,
+        age: int = None,
         incidentid: str = None,
         unsupported_list=None,
+        incidentids=None,
+        trend: bool = False,
+        score: float = None,
     ):
         if unsupported_list is None:
             unsupported_list = []
         self.alist = alist
         self.guid = guid
         self.age = age
-        self.incidentid = incidentid
+        self.incidentids = list(incidentids) if incidentids else []
+        if incidentid is not None:
+            self.incidentid = incidentid
         self.unsupported_list = unsupported_list
+        # Asks for counts over time of the list instead of its latest rows.
+        self.trend = trend
+        # Confidence of the recognizer in the intent; not kept in dialog state.
+        self.score = score
+
+    @property
+    def age(self) -> int:
+        """
+        Number of days; a digit string is stored as an int, anything else is kept for validation to reject.
+        """
+        return self._age
+
+    @age.setter
+    def age(self, value):
+        self._age = int(value) if isinstance(value, str) and value.strip().isdigit() else value
+
+    @property
+    def incidentid(self) -> str:
+        """
+        The first of the incidents asked about.
+        """
+        return self.incidentids[0] if self.incidentids else None
+
+    @incidentid.setter
+    def incidentid(self, value: str):
+        self.incidentids = [] if value is None else [value]
+
+    def to_state(self) -> list:
+        """
+        The details as the compact list kept in dialog state:
+        [version, alist, guid, age, incidentids, unsupported_list, trend].
+        """
+        return [STATE_VERSION, self.alist, self.guid, self.age, self.incidentids, self.unsupported_list, int(self.trend)]
+
+    @classmethod
+    def from_state(cls, state) -> "ShowListDetails":
+        """
+        Reads what to_state returned; a ShowListDetails is returned as is. State it cannot read, e.g. kept by an
+        older version of the bot, gives None.
+        """
+        if isinstance(state, cls):
+            return state
+        if not isinstance(state, (list, tuple)) or len(state) != 7 or state[0] != STATE_VERSION:
+            return None
+        _, alist, guid, age, incidentids, unsupported_list, trend = state
+        return cls(
+            alist=alist,
+            guid=guid,
+            age=age,
+            unsupported_list=list(unsupported_list),
+            incidentids=incidentids,
+            trend=bool(trend),
+        )
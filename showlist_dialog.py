@@ -7,6 +7,7 @@ from botbuilder.dialogs import WaterfallDialog, WaterfallStepContext, DialogTurn
 from botbuilder.dialogs.prompts import ConfirmPrompt, TextPrompt, PromptOptions
 from botbuilder.core import MessageFactory
 from botbuilder.schema import InputHints
+from showlist_details import ShowListDetails
 from .cancel_and_help_dialog import CancelAndHelpDialog
 from .date_resolver_dialog import DateResolverDialog
 
@@ -35,10 +36,13 @@ class ShowListDialog(CancelAndHelpDialog):
         self, step_context: WaterfallStepContext
     ) -> DialogTurnResult:
     
-        showlist_details = step_context.options
+        showlist_details = ShowListDetails.from_state(step_context.options)
+        if showlist_details is None:
+            # Dialog state an older version of the bot kept; the main dialog asks again.
+            return await step_context.end_dialog()
 
         if showlist_details.alist is None:
-            message_text = "I cannot understand you. Do you want to see incidents, outages or changes? Or you need help on an incident?"
+            message_text = "I cannot understand you. Do you want to see incidents, outages, changes or a situation report? Or you need help on an incident?"
             prompt_message = MessageFactory.text(
                 message_text, message_text, InputHints.expecting_input
             )
@@ -55,11 +59,21 @@ class ShowListDialog(CancelAndHelpDialog):
         :param step_context:
         :return DialogTurnResult:
         """
-        showlist_details = step_context.options
+        showlist_details = ShowListDetails.from_state(step_context.options)
+        if showlist_details is None:
+            return await step_context.end_dialog()
 
         # Capture the results of the previous step
         message_text = ""
-        if "Incidents" in showlist_details.alist or "Outages" in showlist_details.alist:
+        if showlist_details.trend and "Changes" in showlist_details.alist:
+            message_text = (
+                f"Please confirm, you want to see the trend of { showlist_details.alist } for Service Tree GUID {showlist_details.guid} over the last {showlist_details.age} days."
+            )
+        elif showlist_details.trend:
+            message_text = (
+                f"Please confirm, you want to see the trend of { showlist_details.alist } over the last {showlist_details.age} days."
+            )
+        elif "Incidents" in showlist_details.alist or "Outages" in showlist_details.alist:
             message_text = (
                 f"Please confirm, you want to see the list of recent { showlist_details.alist }."
             )
@@ -69,7 +83,11 @@ class ShowListDialog(CancelAndHelpDialog):
             )
         elif "Incident" in showlist_details.alist:
             message_text = (
-                f"Please confirm, you need help on { showlist_details.alist } for IncidentId {showlist_details.incidentid}."
+                f"Please confirm, you need help on { showlist_details.alist } for IncidentId {', '.join(showlist_details.incidentids)}."
+            )
+        elif "Report" in showlist_details.alist:
+            message_text = (
+                f"Please confirm, you want to see the situation report of recent incidents, outages and changes."
             )
         else:
             message_text = (
@@ -91,7 +109,7 @@ class ShowListDialog(CancelAndHelpDialog):
         :return DialogTurnResult:
         """
         if step_context.result:
-            showlist_details = step_context.options
+            showlist_details = ShowListDetails.from_state(step_context.options)
 
             return await step_context.end_dialog(showlist_details)
         return await step_context.end_dialog()
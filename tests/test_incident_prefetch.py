@@ -0,0 +1,62 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import time
+import unittest
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.incident_prefetch import IncidentPrefetch
+
+Row = namedtuple('Row', ['ModifiedDate', 'IncidentId', 'Severity', 'Status'])
+
+
+class IncidentPrefetchTest(unittest.TestCase):
+    def test_prefetched_histories_answer_lookups_of_their_conversation(self):
+        prefetch = IncidentPrefetch(wait=0.01)
+        self.assertEqual(prefetch.reserve("c1", [180000001, 180000002]), ["180000001", "180000002"])
+        self.assertEqual(prefetch.reserve("c1", [180000002]), [])
+        prefetch.fill("c1", ["180000001", "180000002"], (Row(None, 180000001, 2, "Active"),))
+        self.assertEqual(prefetch.get("c1", ["180000001"]), {"180000001": (Row(None, 180000001, 2, "Active"),)})
+        self.assertEqual(prefetch.get("c1", ["180000002"]), {"180000002": ()})
+        self.assertIsNone(prefetch.get("c2", ["180000001"]))
+        self.assertIsNone(prefetch.get("c1", ["180000001", "180000003"]))
+        self.assertEqual((prefetch.stats()["hits"], prefetch.stats()["misses"]), (2, 2))
+
+    def test_batch_still_in_flight_is_waited_for_at_most_wait_seconds(self):
+        prefetch = IncidentPrefetch(wait=0.01)
+        prefetch.reserve("c1", ["180000001"])
+        self.assertIsNone(prefetch.get("c1", ["180000001"]))
+        self.assertEqual(prefetch.stats()["late"], 1)
+
+    def test_failed_batch_is_a_miss(self):
+        prefetch = IncidentPrefetch(wait=0.01)
+        prefetch.reserve("c1", ["180000001"])
+        prefetch.fill("c1", ["180000001"], None)
+        self.assertIsNone(prefetch.get("c1", ["180000001"]))
+        self.assertEqual(prefetch.stats()["failed"], 1)
+
+    def test_lists_beyond_max_pending_are_not_prefetched(self):
+        prefetch = IncidentPrefetch(wait=0.01, max_pending=1)
+        self.assertEqual(prefetch.reserve("c1", ["180000001"]), ["180000001"])
+        self.assertEqual(prefetch.reserve("c2", ["180000002"]), [])
+        self.assertIsNone(prefetch.get("c2", ["180000002"]))
+        prefetch.fill("c1", ["180000001"], ())
+        self.assertEqual(prefetch.reserve("c2", ["180000002"]), ["180000002"])
+        self.assertEqual((prefetch.stats()["pending"], prefetch.stats()["skipped"]), (1, 1))
+
+    def test_batch_of_an_expired_conversation_is_dropped(self):
+        prefetch = IncidentPrefetch(ttl=0.01, wait=0.01)
+        prefetch.reserve("c1", ["180000001"])
+        self.assertFalse(prefetch.expired("c1"))
+        time.sleep(0.02)
+        self.assertTrue(prefetch.expired("c1"))
+        prefetch.drop("c1", ["180000001"])
+        self.assertEqual((prefetch.stats()["pending"], prefetch.stats()["dropped"]), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.kusto_scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_LIST, PRIORITY_LOOKUP,
+    CircuitBreaker, CircuitOpenError, ClusterScheduler, KustoRejectedError,
+)
+
+
+def fail():
+    raise RuntimeError("query failed")
+
+
+class Slots:
+    """
+    Holds slots of a scheduler with calls blocked until release().
+    """
+
+    def __init__(self, scheduler, count):
+        self.event = threading.Event()
+        self.threads = [threading.Thread(target=scheduler.run, args=(PRIORITY_LIST, self.event.wait)) for _ in range(count)]
+        for thread in self.threads:
+            thread.start()
+        while scheduler.in_flight < count:
+            time.sleep(0.001)
+
+    def release(self):
+        self.event.set()
+        for thread in self.threads:
+            thread.join()
+
+
+def open_circuit(test, scheduler):
+    for _ in range(scheduler.breaker.min_calls):
+        with test.assertRaises(RuntimeError):
+            scheduler.run(PRIORITY_LIST, fail)
+    test.assertEqual(scheduler.breaker.state, "open")
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_on_failures_and_closes_after_a_successful_probe(self):
+        scheduler = ClusterScheduler(2, 2, CircuitBreaker(min_calls=3, cooldown=0.05))
+        open_circuit(self, scheduler)
+        with self.assertRaises(CircuitOpenError):
+            scheduler.run(PRIORITY_LIST, lambda: "rows")
+        time.sleep(0.06)
+        self.assertEqual(scheduler.run(PRIORITY_LIST, lambda: "rows"), "rows")
+        self.assertEqual(scheduler.breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        scheduler = ClusterScheduler(2, 2, CircuitBreaker(min_calls=3, cooldown=0.05))
+        open_circuit(self, scheduler)
+        time.sleep(0.06)
+        with self.assertRaises(RuntimeError):
+            scheduler.run(PRIORITY_LIST, fail)
+        self.assertEqual(scheduler.breaker.state, "open")
+
+    def test_probe_rejected_by_the_full_queue_is_given_back(self):
+        scheduler = ClusterScheduler(1, 0, CircuitBreaker(min_calls=3, cooldown=0.05))
+        open_circuit(self, scheduler)
+        time.sleep(0.06)
+        # A query admitted before the circuit opened still holds the only slot.
+        scheduler.in_flight = 1
+        with self.assertRaises(KustoRejectedError):
+            scheduler.run(PRIORITY_LIST, lambda: "rows")
+        scheduler.in_flight = 0
+        self.assertEqual(scheduler.run(PRIORITY_LIST, lambda: "rows"), "rows")
+        self.assertEqual(scheduler.breaker.state, "closed")
+
+    def test_probe_timing_out_in_the_queue_is_given_back(self):
+        scheduler = ClusterScheduler(1, 4, CircuitBreaker(min_calls=3, cooldown=0.05))
+        open_circuit(self, scheduler)
+        time.sleep(0.06)
+        # A query admitted before the circuit opened still holds the only slot.
+        scheduler.in_flight = 1
+        with self.assertRaises(KustoRejectedError):
+            scheduler.run(PRIORITY_LIST, lambda: "rows", timeout=0.01)
+        scheduler.in_flight = 0
+        for _ in range(3):
+            self.assertEqual(scheduler.run(PRIORITY_LIST, lambda: "rows"), "rows")
+
+    def test_call_admitted_before_the_circuit_opened_does_not_decide_the_probe(self):
+        scheduler = ClusterScheduler(3, 2, CircuitBreaker(min_calls=3, cooldown=0.05))
+        stale = Slots(scheduler, 1)
+        open_circuit(self, scheduler)
+        time.sleep(0.06)
+        probing = threading.Event()
+
+        def probe():
+            probing.wait()
+            raise RuntimeError("query failed")
+
+        thread = threading.Thread(target=self.assertRaises, args=(RuntimeError, scheduler.run, PRIORITY_LIST, probe))
+        thread.start()
+        while scheduler.in_flight < 2:
+            time.sleep(0.001)
+        stale.release()
+        self.assertEqual(scheduler.breaker.state, "half_open")
+        probing.set()
+        thread.join()
+        self.assertEqual(scheduler.breaker.state, "open")
+
+    def test_errors_that_are_not_failures_leave_the_circuit_closed(self):
+        scheduler = ClusterScheduler(2, 2, CircuitBreaker(min_calls=3), is_failure=lambda error: isinstance(error, TimeoutError))
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                scheduler.run(PRIORITY_LIST, fail)
+        self.assertEqual(scheduler.breaker.state, "closed")
+        self.assertEqual(scheduler.stats()["failed"], 0)
+
+
+class ClusterSchedulerTest(unittest.TestCase):
+    def test_rejects_beyond_the_queue(self):
+        scheduler = ClusterScheduler(1, 0)
+        slots = Slots(scheduler, 1)
+        try:
+            with self.assertRaises(KustoRejectedError):
+                scheduler.run(PRIORITY_LOOKUP, lambda: "rows")
+        finally:
+            slots.release()
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+    def test_waiting_queries_run_in_priority_order(self):
+        scheduler = ClusterScheduler(1, 8)
+        slots = Slots(scheduler, 1)
+        order = []
+        waiting = [
+            threading.Thread(target=scheduler.run, args=(priority, lambda priority=priority: order.append(priority)))
+            for priority in (PRIORITY_BACKGROUND, PRIORITY_LIST, PRIORITY_LOOKUP)
+        ]
+        for number, thread in enumerate(waiting, 1):
+            thread.start()
+            while len(scheduler._queue) < number:
+                time.sleep(0.001)
+        slots.release()
+        for thread in waiting:
+            thread.join()
+        self.assertEqual(order, [PRIORITY_LOOKUP, PRIORITY_LIST, PRIORITY_BACKGROUND])
+
+    def test_waiting_past_the_timeout_is_rejected(self):
+        scheduler = ClusterScheduler(1, 4)
+        slots = Slots(scheduler, 1)
+        try:
+            with self.assertRaises(KustoRejectedError):
+                scheduler.run(PRIORITY_LOOKUP, lambda: "rows", timeout=0.01)
+        finally:
+            slots.release()
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
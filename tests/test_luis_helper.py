@@ -0,0 +1,58 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.luis_helper import _fill_template, _is_cacheable, _make_template, normalize_utterance
+from showlist_details import ShowListDetails
+
+GUID = "7E5380AE-5CC6-41A3-96C8-6D9F91F9DD6C"
+OTHER_GUID = "0a1b2c3d-4e5f-6a7b-8c9d-0e1f2a3b4c5d"
+
+
+class NormalizeUtteranceTest(unittest.TestCase):
+    def test_key_is_lower_cased_and_values_are_kept_as_typed(self):
+        utterance, values = normalize_utterance("Show  changes for {} in last 3 days".format(GUID))
+        self.assertEqual(utterance, "show changes for <guid> in last <num> days")
+        self.assertEqual(values, {"guid": [GUID], "num": ["3"]})
+
+    def test_utterances_differing_in_values_and_case_share_a_key(self):
+        first, _ = normalize_utterance("changes for {} in last 3 days".format(GUID))
+        second, _ = normalize_utterance("Changes for {} in last 15 days".format(OTHER_GUID))
+        self.assertEqual(first, second)
+
+
+class TemplateTest(unittest.TestCase):
+    def test_round_trip_substitutes_the_values_of_the_new_utterance(self):
+        _, values = normalize_utterance("changes for {} in last 3 days".format(GUID))
+        template = _make_template(ShowListDetails(alist="Changes", guid=GUID, age=3, score=0.9), values)
+        self.assertTrue(_is_cacheable(template))
+        self.assertEqual((template.guid, template.age), ("<guid0>", "<num0>"))
+
+        _, values = normalize_utterance("changes for {} in last 15 days".format(OTHER_GUID.upper()))
+        result = _fill_template(template, values)
+        self.assertEqual((result.alist, result.guid, result.age, result.score), ("Changes", OTHER_GUID.upper(), 15, 0.9))
+
+    def test_guid_keeps_its_case_on_a_cache_hit(self):
+        _, values = normalize_utterance("changes for {} in last 3 days".format(GUID))
+        template = _make_template(ShowListDetails(alist="Changes", guid=GUID, age=3), values)
+        self.assertEqual(_fill_template(template, values).guid, GUID)
+
+    def test_incident_ids(self):
+        _, values = normalize_utterance("incident 173678618 and 130063491")
+        template = _make_template(ShowListDetails(alist="Incident", incidentids=["173678618", "130063491"]), values)
+        _, values = normalize_utterance("incident 111111111 and 222222222")
+        self.assertEqual(_fill_template(template, values).incidentids, ["111111111", "222222222"])
+
+    def test_values_not_taken_from_the_utterance_are_not_cacheable(self):
+        _, values = normalize_utterance("changes for the last week")
+        template = _make_template(ShowListDetails(alist="Changes", age=7), values)
+        self.assertFalse(_is_cacheable(template))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.pattern_extractor import extract_show_list, is_complete
+from showlist_details import ShowListDetails
+
+
+class ExtractShowListTest(unittest.TestCase):
+    def test_incident_ids(self):
+        result = extract_show_list("please help on incident 173678618 and #130063491")
+        self.assertEqual(result.alist, "Incident")
+        self.assertEqual(result.incidentids, ["173678618", "130063491"])
+
+    def test_every_incident_id_is_collected(self):
+        result = extract_show_list("incident 173678618 and incident 173678619, please")
+        self.assertEqual(result.incidentids, ["173678618", "173678619"])
+
+    def test_messages_saying_more_than_the_pattern_are_left_to_the_recognizers(self):
+        for text in (
+            "how do I close incident 173678618",
+            "incident 173678618 is a duplicate of incident 173678619",
+            "changes for 7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c in last 3 days except deployments",
+            "changes for 7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c in last 3 days 42",
+        ):
+            self.assertIsNone(extract_show_list(text), text)
+
+    def test_numbers_not_shaped_like_incident_ids_are_left_to_the_recognizers(self):
+        for text in ("incidents 10", "incident 12", "incident 1234567890123", "show me incidents 10 days"):
+            self.assertIsNone(extract_show_list(text), text)
+
+    def test_changes(self):
+        result = extract_show_list("changes for 7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c in last 3 days")
+        self.assertEqual((result.alist, result.guid, result.age), ("Changes", "7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c", 3))
+
+    def test_more(self):
+        self.assertEqual(extract_show_list("show more").alist, "More")
+
+    def test_trends_are_left_to_the_recognizers(self):
+        self.assertIsNone(extract_show_list("incident 173678618 trend"))
+
+
+class IsCompleteTest(unittest.TestCase):
+    def test_complete(self):
+        self.assertTrue(is_complete(ShowListDetails(alist="Incidents")))
+        self.assertTrue(is_complete(ShowListDetails(alist="Incident", incidentids=["173678618"])))
+        self.assertTrue(is_complete(ShowListDetails(alist="Outages", age=7, trend=True)))
+
+    def test_incomplete(self):
+        self.assertFalse(is_complete(ShowListDetails(alist="Incident", incidentids=["12"])))
+        self.assertFalse(is_complete(ShowListDetails(alist="Changes", guid="not-a-guid", age=3)))
+        self.assertFalse(is_complete(ShowListDetails(alist="Incidents", unsupported_list=["Alerts"])))
+        self.assertFalse(is_complete(ShowListDetails()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from showlist_details import STATE_VERSION, ShowListDetails
+
+
+class ShowListDetailsStateTest(unittest.TestCase):
+    def test_round_trip(self):
+        details = ShowListDetails(alist="Changes", guid="7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c", age="3",
+                                  incidentids=["173678618"], unsupported_list=["Bugs"], trend=True, score=0.9)
+        result = ShowListDetails.from_state(details.to_state())
+        self.assertEqual(
+            (result.alist, result.guid, result.age, result.incidentids, result.unsupported_list, result.trend),
+            ("Changes", "7e5380ae-5cc6-41a3-96c8-6d9f91f9dd6c", 3, ["173678618"], ["Bugs"], True))
+        self.assertIsNone(result.score)
+
+    def test_details_are_returned_as_is(self):
+        details = ShowListDetails(alist="Report")
+        self.assertIs(ShowListDetails.from_state(details), details)
+
+    def test_unreadable_state_gives_none(self):
+        for state in (None, [], [STATE_VERSION + 1, "Incidents", None, None, [], [], 0], [STATE_VERSION, "Incidents"],
+                      {"py/object": "showlist_details.ShowListDetails", "alist": "Incidents"}):
+            self.assertIsNone(ShowListDetails.from_state(state))
+
+
+if __name__ == '__main__':
+    unittest.main()
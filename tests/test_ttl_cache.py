@@ -0,0 +1,74 @@
+"""
+    python -m unittest discover helpers/tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from helpers.ttl_cache import TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_expired_entries_are_missed_but_kept_for_get_stale(self):
+        cache = TTLCache(default_ttl=0.01)
+        cache.put("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.get_stale("key"), "value")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get_stale("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_concurrent_loads_of_a_key_call_the_loader_once(self):
+        cache = TTLCache()
+        calls = []
+        started = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader))) for _ in range(4)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 4)
+        self.assertEqual(cache.stats()["coalesced"], 3)
+
+    def test_failed_load_is_raised_to_waiters_and_not_cached(self):
+        cache = TTLCache()
+
+        def loader():
+            raise RuntimeError("query failed")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_load("key", loader)
+        self.assertEqual(cache.get_or_load("key", lambda: "value"), "value")
+
+    def test_none_is_not_cached(self):
+        cache = TTLCache()
+        self.assertIsNone(cache.get_or_load("key", lambda: None))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()